@@ -0,0 +1,114 @@
+"""Benchmark do export e das estatísticas do histórico (src.services.analytics).
+
+Cria um banco SQLite com `--years` de histórico de um usuário: uma linha diária em
+health_metrics e pontos de passos/batimentos a cada `--bucket-minutes`. Mede, em
+processo, a leitura do histórico diário para arrays, o cálculo das estatísticas e o
+export dos pontos para Parquet, com o pico de RSS de cada etapa. Imprime uma linha JSON.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.analytics --years 1
+    python -m benchmarks.analytics --years 5 --bucket-minutes 15 --chunk-rows 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+# Primeiro: define o ambiente mínimo para importar src.* fora do container
+import benchmarks.standins  # noqa: F401
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+def peak_rss_mb() -> float:
+    # ru_maxrss vem em KiB no Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+async def setup_database(url: str, years: int, bucket_minutes: int):
+    from src.database.connection import Base, AsyncSessionLocal
+    from src.models.google_fit import STEPS, HEART_RATE
+    from src.models.health_metric import User, HealthMetric, HealthDataPoint
+
+    engine = create_async_engine(url)
+    AsyncSessionLocal.configure(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [{"id": 1, "email": "analytics@bench", "google_id": "analytics"}])
+
+    rng = random.Random(42)
+    end = date.today()
+    days = [end - timedelta(days=i) for i in range(years * 365)]
+    async with engine.begin() as conn:
+        await conn.execute(insert(HealthMetric), [
+            {
+                "user_id": 1, "date": day, "steps": rng.randint(2000, 15000),
+                "sleep_hours": round(rng.uniform(5, 9), 2), "heart_rate_avg": round(rng.uniform(55, 90), 1),
+            }
+            for day in days if rng.random() > 0.05  # alguns dias sem registro
+        ])
+
+    step = timedelta(minutes=bucket_minutes)
+    points = 0
+    for day in days:
+        start = datetime.combine(day, datetime.min.time())
+        rows = []
+        for i in range(24 * 60 // bucket_minutes):
+            begin = start + i * step
+            rows.append({"user_id": 1, "data_type": STEPS, "start_time": begin, "end_time": begin + step, "value": rng.randint(0, 900)})
+            rows.append({"user_id": 1, "data_type": HEART_RATE, "start_time": begin, "end_time": begin + step, "value": rng.uniform(50, 120)})
+        async with engine.begin() as conn:
+            await conn.execute(insert(HealthDataPoint), rows)
+        points += len(rows)
+    return engine, points
+
+async def run(args):
+    from src.services import analytics
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, points = await setup_database(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}", args.years, args.bucket_minutes)
+        baseline_rss = peak_rss_mb()
+        try:
+            started = time.perf_counter()
+            history = await analytics.load_daily_history(1, chunk_rows=args.chunk_rows)
+            loaded = time.perf_counter()
+            runs = 100
+            for _ in range(runs):
+                summary = analytics.summarize(history)
+            computed = time.perf_counter()
+
+            path = os.path.join(tmp, "points.parquet")
+            rows = await analytics.export_parquet(1, path, "points", chunk_rows=args.chunk_rows)
+            exported = time.perf_counter()
+            size_mb = os.path.getsize(path) / 1024 / 1024
+        finally:
+            await engine.dispose()
+
+    return {
+        "benchmark": "analytics",
+        "years": args.years,
+        "days": summary["days"],
+        "points": points,
+        "load_daily_ms": round((loaded - started) * 1000, 1),
+        "summarize_ms": round((computed - loaded) * 1000 / runs, 3),
+        "export_points_s": round(exported - computed, 2),
+        "export_rows": rows,
+        "parquet_mb": round(size_mb, 1),
+        "rss_before_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--bucket-minutes", type=int, default=15)
+    parser.add_argument("--chunk-rows", type=int, default=10000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args))), flush=True)
+
+if __name__ == "__main__":
+    main()
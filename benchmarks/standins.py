@@ -0,0 +1,261 @@
+"""Stand-ins locais do Google Fit, do OAuth do Google e do api.telegram.org para benchmarks.
+
+Cada stand-in responde como o serviço real (só o necessário para o bot) e injeta
+latência, erros 5xx e 429 em taxas configuráveis. Dois modos de ligação:
+
+- `mock_transport(...)`: tudo no processo via httpx.MockTransport (sem sockets);
+- `serve(...)`: um servidor aiohttp por stand-in em 127.0.0.1 e um transport que
+  reescreve os hosts reais para eles, passando pelo pool HTTP de verdade.
+
+Importar este módulo define variáveis de ambiente mínimas (se ausentes) para que
+`src.*` possa ser importado fora do container.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from urllib.parse import parse_qsl
+
+for key, value in {
+    "DB_USER": "bench", "DB_PASSWORD": "bench", "DB_HOST": "localhost", "DB_PORT": "3306",
+    "DB_NAME": "bench", "TELEGRAM_BOT_TOKEN": "bench-token", "GOOGLE_CLIENT_ID": "bench",
+    "GOOGLE_CLIENT_SECRET": "bench", "USER_EMAIL": "bench@example.com",
+    "TELEGRAM_WEBHOOK_SECRET": "bench-secret",
+    # Por padrão mede o bot, não o limite global do Telegram
+    "TELEGRAM_GLOBAL_RATE": "1000000",
+}.items():
+    os.environ.setdefault(key, value)
+
+import httpx
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+def percentile(values, p: float):
+    """Percentil por posição (valores já ordenados); None para lista vazia."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+class StandIn:
+    """Base: latência simulada, injeção de falhas e contadores por rota."""
+
+    host = ""
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0, seed: int = 0):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self.counters = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    async def respond(self, method: str, path: str, params: dict, body: bytes):
+        """Retorna (status, payload JSON, headers) para uma requisição."""
+        self.counters["requests"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.counters["rate_limited"] += 1
+            return self.rate_limited()
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.counters["errors"] += 1
+            return 503, {"error": {"code": 503, "message": "stand-in: falha injetada"}}, {}
+        return await self.handle(method, path, params, body)
+
+    def rate_limited(self):
+        return 429, {"error": {"code": 429, "message": "stand-in: quota"}}, {"Retry-After": "1"}
+
+    async def handle(self, method: str, path: str, params: dict, body: bytes):
+        raise NotImplementedError
+
+class GoogleFitStandIn(StandIn):
+    """www.googleapis.com/fitness/v1: dataset:aggregate, dataSources e sessions (sono)."""
+
+    host = "www.googleapis.com"
+
+    async def handle(self, method, path, params, body):
+        if path.endswith("/dataset:aggregate"):
+            return 200, self._aggregate(json.loads(body)), {}
+        if path.endswith("/sessions"):
+            return 200, self._sessions(), {}
+        if path.endswith("/dataSources"):
+            return 200, self._data_sources(), {}
+        return 404, {"error": {"code": 404, "message": f"stand-in: rota desconhecida {path}"}}, {}
+
+    def _aggregate(self, request: dict):
+        start, end = int(request["startTimeMillis"]), int(request["endTimeMillis"])
+        duration = int(request.get("bucketByTime", {}).get("durationMillis") or end - start) or 1
+        buckets = []
+        for i in range(max(1, min(math.ceil((end - start) / duration), 366))):
+            bucket_start = start + i * duration
+            datasets = []
+            for source in request.get("aggregateBy", []):
+                name = source.get("dataTypeName") or source.get("dataSourceId", "")
+                if "heart_rate" in name:
+                    bpm = float(self._random.randint(55, 90))
+                    value = [{"fpVal": bpm}, {"fpVal": bpm + 30}, {"fpVal": bpm - 10}]
+                else:
+                    value = [{"intVal": self._random.randint(2000, 12000)}]
+                datasets.append({"point": [{"value": value}]})
+            buckets.append({
+                "startTimeMillis": str(bucket_start),
+                "endTimeMillis": str(min(bucket_start + duration, end)),
+                "dataset": datasets,
+            })
+        return {"bucket": buckets}
+
+    def _data_sources(self):
+        # Um celular Android típico: as fusões do Google Play Services para passos e batimentos
+        streams = (
+            ("com.google.step_count.delta", "derived:com.google.step_count.delta:com.google.android.gms:estimated_steps"),
+            ("com.google.heart_rate.bpm", "derived:com.google.heart_rate.bpm:com.google.android.gms:merge_heart_rate_bpm"),
+        )
+        return {"dataSource": [
+            {"dataStreamId": stream, "dataType": {"name": name}, "type": "derived",
+             "application": {"packageName": "com.google.android.gms"}}
+            for name, stream in streams
+        ]}
+
+    def _sessions(self):
+        end = int(time.time() * 1000) - 60 * 60 * 1000
+        start = end - int(self._random.uniform(5, 9) * 60 * 60 * 1000)
+        return {"session": [{"startTimeMillis": str(start), "endTimeMillis": str(end), "activityType": 72}]}
+
+class OAuthStandIn(StandIn):
+    """oauth2.googleapis.com/token: renova qualquer refresh token."""
+
+    host = "oauth2.googleapis.com"
+
+    async def handle(self, method, path, params, body):
+        form = dict(parse_qsl(body.decode()))
+        if form.get("grant_type") != "refresh_token" or not form.get("refresh_token"):
+            return 400, {"error": "invalid_grant"}, {}
+        self.counters.setdefault("refreshes", 0)
+        self.counters["refreshes"] += 1
+        return 200, {
+            "access_token": f"bench-{form['refresh_token']}-{self.counters['refreshes']}",
+            "expires_in": 3600,
+            "token_type": "Bearer",
+        }, {}
+
+class TelegramStandIn(StandIn):
+    """api.telegram.org: serve getUpdates a partir dos updates injetados e registra sendMessage/sendPhoto."""
+
+    host = "api.telegram.org"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = []
+        self.injected_at = {}
+        self.delivered_at = {}
+        self.changed = asyncio.Condition()
+
+    def rate_limited(self):
+        return 429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}}, {}
+
+    async def inject(self, update: dict):
+        chat_id = str(update["message"]["chat"]["id"]) if "message" in update else None
+        if chat_id:
+            self.injected_at.setdefault(chat_id, time.perf_counter())
+        async with self.changed:
+            self.pending.append(update)
+            self.changed.notify_all()
+
+    async def handle(self, method, path, params, body):
+        api_method = path.rsplit("/", 1)[-1]
+        if api_method == "sendMessage":
+            chat_id = str(json.loads(body)["chat_id"])
+            self.delivered_at.setdefault(chat_id, time.perf_counter())
+            return 200, {"ok": True, "result": {}}, {}
+        if api_method == "sendPhoto":
+            # Upload multipart (bytes) ou reenvio por file_id (JSON)
+            uploaded = not body.startswith(b"{")
+            self.counters["photo_uploads" if uploaded else "photo_file_ids"] = (
+                self.counters.get("photo_uploads" if uploaded else "photo_file_ids", 0) + 1
+            )
+            file_id = f"stand-in-photo-{self.counters.get('photo_uploads', 0)}"
+            return 200, {"ok": True, "result": {"photo": [{"file_id": f"{file_id}-thumb"}, {"file_id": file_id}]}}, {}
+        if api_method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}, {}
+        return 200, {"ok": True, "result": True}, {}
+
+    async def _get_updates(self, params: dict):
+        offset = int(params.get("offset", 0))
+        timeout = float(params.get("timeout", 0))
+
+        def ready():
+            return [u for u in self.pending if u["update_id"] >= offset][:100]
+
+        async with self.changed:
+            try:
+                await asyncio.wait_for(self.changed.wait_for(lambda: bool(ready())), timeout)
+            except asyncio.TimeoutError:
+                return []
+            batch = ready()
+            # Como no Telegram: confirmar um offset descarta os anteriores
+            self.pending = [u for u in self.pending if u["update_id"] >= offset]
+            return batch
+
+def _by_host(standins):
+    return {standin.host: standin for standin in standins}
+
+def mock_transport(*standins) -> httpx.MockTransport:
+    """Transport em processo que entrega cada requisição ao stand-in do host."""
+    routes = _by_host(standins)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        standin = routes.get(request.url.host)
+        if standin is None:
+            return httpx.Response(502, json={"error": f"sem stand-in para {request.url.host}"})
+        status, payload, headers = await standin.respond(
+            request.method, request.url.path, dict(request.url.params), request.content
+        )
+        return httpx.Response(status, json=payload, headers=headers)
+
+    return httpx.MockTransport(handler)
+
+class LocalRouteTransport(httpx.AsyncBaseTransport):
+    """Reescreve os hosts reais para os servidores locais e usa um pool HTTP de verdade."""
+
+    def __init__(self, ports: dict, **kwargs):
+        self._ports = ports
+        self._transport = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        port = self._ports.get(request.url.host)
+        if port:
+            request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=port)
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+async def serve(*standins, **transport_kwargs):
+    """Sobe um servidor aiohttp por stand-in; retorna (transport, cleanup)."""
+    # Import tardio: benchmarks.startup usa os stand-ins sem pagar pelo aiohttp
+    from aiohttp import web
+
+    runners, ports = [], {}
+    for standin in standins:
+        async def handler(request, standin=standin):
+            status, payload, headers = await standin.respond(
+                request.method, request.path, dict(request.query), await request.read()
+            )
+            return web.json_response(payload, status=status, headers=headers)
+
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        ports[standin.host] = site._server.sockets[0].getsockname()[1]
+        runners.append(runner)
+
+    async def cleanup():
+        for runner in runners:
+            await runner.cleanup()
+
+    return LocalRouteTransport(ports, **transport_kwargs), cleanup
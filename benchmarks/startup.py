@@ -0,0 +1,210 @@
+"""Benchmark de partida a frio: tempo de import dos entrypoints e tempo até o primeiro poll.
+
+Cada medição roda num processo novo, como um restart do container (`restart: always`):
+
+- import: `python -X importtime -c "import <entrypoint>"`; imprime a mediana do total,
+  os pacotes mais caros e quais dependências pesadas entraram no grafo;
+- primeiro poll: sobe `src.main.main()` de verdade (migrações, fila, tokens, agendador)
+  contra SQLite e um stand-in do api.telegram.org e mede do spawn do processo até o
+  primeiro getUpdates, separando interpretador, imports e inicialização.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --entrypoints src.main,main,src.backfill
+    python -m benchmarks.startup --no-bytecode   # sem nenhum .pyc em cache (pior caso)
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Dependências que o polling/agendador não deveriam carregar no import
+HEAVY_MODULES = ("aiohttp", "apscheduler", "google_auth_oauthlib", "googleapiclient", "google.oauth2", "h2")
+
+def child_env(pycache_prefix: str = None, **extra) -> dict:
+    env = {**os.environ, "PYTHONPATH": str(ROOT), **extra}
+    if pycache_prefix:
+        env["PYTHONPYCACHEPREFIX"] = pycache_prefix
+    return env
+
+def parse_importtime(stderr: str) -> dict:
+    """Linhas do -X importtime -> {módulo: (próprio_us, acumulado_us)}."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.setdefault(name.strip(), (int(own), int(cumulative)))
+    return modules
+
+def import_run(entrypoint: str, env: dict) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {entrypoint}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"import {entrypoint} falhou:\n{proc.stderr[-2000:]}")
+    modules = parse_importtime(proc.stderr)
+    # Raiz de cada pacote de terceiros: o acumulado inclui o que ele mesmo importa
+    packages = {
+        name: cumulative for name, (_, cumulative) in modules.items()
+        if "." not in name and name not in ("src", entrypoint)
+    }
+    return {
+        "total_ms": modules[entrypoint][1] / 1000,
+        "modules": len(modules),
+        "packages": packages,
+        "heavy": [name for name in HEAVY_MODULES if name in modules],
+    }
+
+def bench_imports(entrypoint: str, runs: int, no_bytecode: bool) -> dict:
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as pycache:
+            samples.append(import_run(entrypoint, child_env(pycache if no_bytecode else None)))
+    samples.sort(key=lambda s: s["total_ms"])
+    median = samples[len(samples) // 2]
+    top = sorted(median["packages"].items(), key=lambda item: item[1], reverse=True)[:8]
+    return {
+        "benchmark": "import",
+        "entrypoint": entrypoint,
+        "runs": runs,
+        "import_ms_p50": round(median["total_ms"], 1),
+        "import_ms_min": round(samples[0]["total_ms"], 1),
+        "modules": median["modules"],
+        "top_packages_ms": {name: round(us / 1000, 1) for name, us in top},
+        "heavy_loaded": median["heavy"],
+    }
+
+def first_poll_run(db_path: str, no_bytecode: bool) -> dict:
+    with tempfile.TemporaryDirectory() as pycache:
+        env = child_env(
+            pycache if no_bytecode else None,
+            STARTUP_SPAWNED_AT=repr(time.time()),
+            # Porta efêmera: não disputa a 9100 com um bot rodando na máquina
+            METRICS_PORT="0",
+        )
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--first-poll-child", db_path],
+            cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+        )
+    if proc.returncode:
+        raise RuntimeError(f"processo do bot falhou:\n{proc.stderr[-3000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def bench_first_poll(runs: int, no_bytecode: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "startup.db")
+        # Aquecimento: cria o schema, como num restart de um banco já migrado
+        first_poll_run(db_path, no_bytecode)
+        samples = [first_poll_run(db_path, no_bytecode) for _ in range(runs)]
+
+    def p50(key):
+        return round(statistics.median(s[key] for s in samples), 1)
+
+    return {
+        "benchmark": "first_poll",
+        "entrypoint": "src.main",
+        "runs": runs,
+        "interpreter_ms_p50": p50("interpreter_ms"),
+        "import_ms_p50": p50("import_ms"),
+        "startup_ms_p50": p50("startup_ms"),
+        "time_to_first_poll_ms_p50": p50("total_ms"),
+        "time_to_first_poll_ms_max": round(max(s["total_ms"] for s in samples), 1),
+        "heavy_loaded": samples[-1]["heavy"],
+    }
+
+async def _run_until_first_poll(bot, db_path: str):
+    import httpx
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from benchmarks.standins import TelegramStandIn, mock_transport
+    from src.clients import http_client
+    from src.database import migrations
+    from src.database.connection import AsyncSessionLocal
+    from src.services import scheduler_service
+
+    first_poll = asyncio.Event()
+
+    class FirstPollTelegram(TelegramStandIn):
+        async def _get_updates(self, params):
+            first_poll.set()
+            return await super()._get_updates(params)
+
+    # O bot de verdade, só com o banco e o Telegram trocados pelos locais
+    migrations.engine = create_engine(f"sqlite:///{db_path}")
+    scheduler_service.engine = migrations.engine  # job store do APScheduler
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    AsyncSessionLocal.configure(bind=engine)
+    http_client._client = httpx.AsyncClient(transport=mock_transport(FirstPollTelegram()))
+
+    started = time.time()
+    bot_task = asyncio.create_task(bot.main())
+    poll_task = asyncio.create_task(first_poll.wait())
+    await asyncio.wait({bot_task, poll_task}, timeout=60, return_when=asyncio.FIRST_COMPLETED)
+    polled = time.time()
+    if bot_task.done():
+        bot_task.result()
+        raise RuntimeError("o bot encerrou antes do primeiro getUpdates")
+    if not first_poll.is_set():
+        raise RuntimeError("nenhum getUpdates em 60s")
+
+    bot_task.cancel()
+    poll_task.cancel()
+    try:
+        await bot_task
+    except asyncio.CancelledError:
+        pass
+    await engine.dispose()
+    migrations.engine.dispose()
+    return started, polled
+
+def first_poll_child(db_path: str):
+    """Roda dentro do processo medido: importa o bot, sobe o main() e sai no primeiro poll."""
+    spawned_at = float(os.environ["STARTUP_SPAWNED_AT"])
+    import_started = time.time()
+    import benchmarks.standins  # noqa: F401  (ambiente mínimo antes de src.*)
+    import src.main as bot
+    imported = time.time()
+
+    started, polled = asyncio.run(_run_until_first_poll(bot, db_path))
+    print(json.dumps({
+        "interpreter_ms": (import_started - spawned_at) * 1000,
+        "import_ms": (imported - import_started) * 1000,
+        "startup_ms": (polled - started) * 1000,
+        "total_ms": (polled - spawned_at) * 1000,
+        "heavy": [name for name in HEAVY_MODULES if name in sys.modules],
+    }), flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="processos medidos por cenário (mediana)")
+    parser.add_argument("--entrypoints", default="src.main,main,src.backfill",
+                        help="módulos importados na medição de import, separados por vírgula")
+    parser.add_argument("--no-bytecode", action="store_true",
+                        help="cada processo com cache de .pyc vazio (imagem sem bytecode compilado)")
+    parser.add_argument("--skip-first-poll", action="store_true", help="mede só os imports")
+    parser.add_argument("--first-poll-child", metavar="DB_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.first_poll_child:
+        first_poll_child(args.first_poll_child)
+        return
+
+    # Só no processo pai: os filhos herdam o ambiente mínimo de src.* sem pagar o import aqui
+    import benchmarks.standins  # noqa: F401
+    for entrypoint in args.entrypoints.split(","):
+        print(json.dumps(bench_imports(entrypoint, args.runs, args.no_bytecode)), flush=True)
+    if not args.skip_first_poll:
+        print(json.dumps(bench_first_poll(args.runs, args.no_bytecode)), flush=True)
+
+if __name__ == "__main__":
+    main()
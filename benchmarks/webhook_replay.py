@@ -0,0 +1,148 @@
+"""Replay de updates gravados do Telegram contra o bot (webhook ou polling).
+
+Mede a latência fim a fim de comandos (update injetado -> sendMessage recebido)
+e a vazão em updates/s, usando um stand-in local do api.telegram.org e SQLite.
+
+Uso (na raiz do repositório):
+    python -m benchmarks.webhook_replay --mode webhook --updates 2000 --rate 500
+    python -m benchmarks.webhook_replay --mode polling --updates 2000 --rate 500
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+# Primeiro: define o ambiente mínimo para importar src.* fora do container
+from benchmarks.standins import TelegramStandIn, mock_transport, percentile
+
+import aiohttp
+import httpx
+from aiohttp import web
+from sqlalchemy.ext.asyncio import create_async_engine
+
+RECORDED_UPDATES = Path(__file__).parent / "data" / "telegram_updates.json"
+
+def expand_updates(count: int):
+    """Repete os updates gravados com update_id e chat_id únicos."""
+    recorded = json.loads(RECORDED_UPDATES.read_text())
+    updates = []
+    for i in range(count):
+        update = copy.deepcopy(recorded[i % len(recorded)])
+        update["update_id"] = i + 1
+        message = update.get("message") or update.get("edited_message")
+        message["chat"]["id"] = 100000 + i
+        updates.append(update)
+    return updates
+
+async def setup_database(path: str):
+    from src.config.settings import settings
+    from src.database.connection import Base, AsyncSessionLocal
+    from src.models.health_metric import User
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    AsyncSessionLocal.configure(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        db.add(User(email=settings.USER_EMAIL, google_id="bench"))
+        await db.commit()
+    return engine
+
+async def replay(args):
+    from src.config.settings import settings
+    from src.clients import http_client
+    from src.main import handle_updates
+    from src.services.telegram_dispatcher import dispatcher
+    from src.services.telegram_queue import telegram_queue
+    from src.services.telegram_webhook import create_webhook_app, SECRET_HEADER
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = await setup_database(os.path.join(tmp, "bench.db"))
+        standin = TelegramStandIn(latency_ms=args.latency_ms)
+        # O cliente compartilhado passa a falar com o stand-in em vez do api.telegram.org
+        http_client._client = httpx.AsyncClient(transport=mock_transport(standin))
+        telegram_queue.start()
+
+        updates = expand_updates(args.updates)
+        commands = {
+            str(u["message"]["chat"]["id"]) for u in updates
+            if dispatcher.parse_command(u.get("message", {})) is not None
+        }
+        interval = 1 / args.rate if args.rate else 0
+
+        runner = poller = None
+        if args.mode == "webhook":
+            runner = web.AppRunner(create_webhook_app())
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            webhook_url = f"http://127.0.0.1:{port}{settings.WEBHOOK_PATH}"
+            session = aiohttp.ClientSession(headers={SECRET_HEADER: settings.TELEGRAM_WEBHOOK_SECRET})
+
+            async def deliver(update):
+                await standin.inject(update)
+                async with session.post(webhook_url, json=update) as resp:
+                    resp.raise_for_status()
+        else:
+            poller = asyncio.create_task(handle_updates())
+            session = None
+
+            async def deliver(update):
+                await standin.inject(update)
+
+        started = time.perf_counter()
+        posts = []
+        for update in updates:
+            posts.append(asyncio.create_task(deliver(update)))
+            if interval:
+                await asyncio.sleep(interval)
+        await asyncio.gather(*posts)
+
+        deadline = time.perf_counter() + args.timeout
+        while len(standin.delivered_at) < len(commands) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        if poller:
+            poller.cancel()
+        if runner:
+            await session.close()
+            await runner.cleanup()
+        await dispatcher.drain()
+        await telegram_queue.stop()
+        await http_client.close_http_client()
+        await engine.dispose()
+
+    latencies = sorted(
+        (standin.delivered_at[c] - standin.injected_at[c]) * 1000
+        for c in commands if c in standin.delivered_at
+    )
+    return {
+        "mode": args.mode,
+        "updates": len(updates),
+        "commands": len(commands),
+        "delivered": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(updates) / elapsed, 1),
+        "latency_p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "latency_p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["webhook", "polling"], default="webhook")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="updates/s injetados (0 = sem limite)")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="latência simulada do api.telegram.org")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(replay(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import logging
 from google_auth_oauthlib.flow import InstalledAppFlow
 from src.config.settings import settings
-from src.database.connection import engine, Base, SessionLocal
+from src.database.connection import session_scope
+from src.database.migrations import run_migrations
 from src.models.health_metric import User, OAuthToken, HealthMetric 
 
 # Configuração de logs para acompanhar o processo no terminal
@@ -20,7 +21,7 @@ SCOPES = [
 def run_auth_flow():
     # 1. Garante que as tabelas existam no MariaDB do CasaOS
     logger.info("🛠️ Verificando/Criando tabelas no banco de dados...")
-    Base.metadata.create_all(bind=engine)
+    run_migrations()
 
     # Configuração baseada nas credenciais que você baixou do Google Cloud
     client_config = {
@@ -40,39 +41,35 @@ def run_auth_flow():
 
     logger.info("✅ Autenticação realizada com sucesso no Google!")
 
-    # 3. Persistência dos dados no banco MariaDB
-    db = SessionLocal()
+    # 3. Persistência dos dados no banco MariaDB (commit ao sair do bloco, rollback se falhar)
     try:
         # Puxa o e-mail definido no seu arquivo .env
         meu_email = settings.USER_EMAIL 
-        
-        # Verifica se o usuário já existe, senão cria
-        user = db.query(User).filter_by(email=meu_email).first()
-        if not user:
-            logger.info(f"Criando novo usuário no banco: {meu_email}")
-            user = User(email=meu_email, google_id="google_authenticated_user")
-            db.add(user)
-            db.flush() # Gera o ID necessário para o relacionamento do Token
+        with session_scope() as db:
+            # Verifica se o usuário já existe, senão cria
+            user = db.query(User).filter_by(email=meu_email).first()
+            if not user:
+                logger.info(f"Criando novo usuário no banco: {meu_email}")
+                user = User(email=meu_email, google_id="google_authenticated_user")
+                db.add(user)
+                db.flush() # Gera o ID necessário para o relacionamento do Token
 
-        # Busca ou cria o registro de token para este usuário
-        token_entry = db.query(OAuthToken).filter_by(user_id=user.id).first()
-        if not token_entry:
-            token_entry = OAuthToken(user_id=user.id)
-            db.add(token_entry)
+            # Busca ou cria o registro de token para este usuário
+            token_entry = db.query(OAuthToken).filter_by(user_id=user.id).first()
+            if not token_entry:
+                token_entry = OAuthToken(user_id=user.id)
+                db.add(token_entry)
 
-        # Atualiza os dados do token (incluindo o vital Refresh Token)
-        token_entry.access_token = creds.token
-        token_entry.refresh_token = creds.refresh_token 
-        token_entry.expires_at = creds.expiry
+            # Atualiza os dados do token (incluindo o vital Refresh Token)
+            token_entry.access_token = creds.token
+            token_entry.refresh_token = creds.refresh_token 
+            token_entry.expires_at = creds.expiry
 
-        db.commit()
         logger.info(f"🚀 SUCESSO! Refresh Token guardado para o e-mail do .env: {meu_email}")
+        logger.info(f"📚 Para carregar o histórico: python -m src.backfill --email {meu_email} --days 365")
         
     except Exception as e:
-        db.rollback()
         logger.error(f"❌ Erro ao salvar no banco: {e}")
-    finally:
-        db.close()
 
 if __name__ == "__main__":
     # Lembre-se de rodar: set PYTHONPATH=. antes de executar
@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import logging
+from datetime import date, timedelta
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("mensageiro-fit")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Carrega o histórico do Google Fit em health_metrics.")
+    parser.add_argument("--days", type=int, default=365, help="quantos dias para trás (padrão: 365)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="último dia (padrão: ontem)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user-id", type=int, action="append", help="usuário a carregar (pode repetir)")
+    target.add_argument("--email", action="append", help="e-mail do usuário a carregar (pode repetir)")
+    target.add_argument("--all", action="store_true", help="todos os usuários com token OAuth")
+    return parser.parse_args()
+
+async def resolve_user_ids(args):
+    from sqlalchemy import select
+    from src.database.connection import db_session
+    from src.models.health_metric import User, OAuthToken
+
+    async with db_session() as db:
+        if args.user_id:
+            return args.user_id
+        query = select(User.id).join(OAuthToken, OAuthToken.user_id == User.id)
+        if args.email:
+            query = query.where(User.email.in_(args.email))
+        return (await db.execute(query)).scalars().all()
+
+async def main():
+    args = parse_args()
+    # Banco, Settings e clientes só carregam depois dos argumentos: --help e erros de uso saem na hora
+    from src.clients.http_client import close_http_client
+    from src.database.connection import dispose_engines
+    from src.database.migrations import run_migrations
+    from src.services.backfill_service import BackfillService
+    from src.services.token_manager import token_manager
+
+    end = args.end or date.today() - timedelta(days=1)
+    start = end - timedelta(days=args.days - 1)
+
+    await asyncio.to_thread(run_migrations)
+    try:
+        user_ids = await resolve_user_ids(args)
+        logger.info(f"📚 Backfill de {start} a {end} para {len(user_ids)} usuários")
+        # Rodar de novo com o mesmo intervalo retoma do checkpoint de cada usuário
+        await BackfillService().backfill_users(user_ids, start, end)
+    finally:
+        await token_manager.flush()
+        await close_http_client()
+        await dispose_engines()
+
+if __name__ == "__main__":
+    # Lembre-se de rodar: set PYTHONPATH=. antes de executar
+    asyncio.run(main())
@@ -1,47 +1,167 @@
+import asyncio
+import datetime
+import email.utils
 import logging
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+import random
+import time
+from typing import Optional
+import httpx
+from src.clients.http_client import get_http_client
 from src.config.settings import settings
+from src.services.circuit_breaker import breaker_for
+from src.services.metrics import FAILURES, RETRIES
+from src.models.google_fit import AggregateRequest, Bucket, DataSource, SleepSession, SLEEP_ACTIVITY_TYPE
 
 logger = logging.getLogger("mensageiro-fit")
 
+BASE_URL = "https://www.googleapis.com/fitness/v1/users/me"
+
+class GoogleFitError(Exception):
+    """Resposta de erro da API Fitness; 429 e 5xx valem nova tentativa depois de `retry_after`."""
+
+    def __init__(self, status_code: int, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"Google Fit respondeu {status_code}: {message[:200]}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code == 429 or self.status_code >= 500
+
+class FitTimeoutError(GoogleFitError):
+    """A chamada estourou o prazo próprio ou o orçamento de tempo do relatório."""
+
+    def __init__(self, endpoint: str):
+        super().__init__(504, f"prazo esgotado em {endpoint}")
+
+class FitCircuitOpenError(GoogleFitError):
+    """Disjuntor do endpoint aberto: falha rápida sem chamar o Google."""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(503, f"circuito aberto em {endpoint}", retry_after)
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After em segundos ou como data HTTP; valor inválido é ignorado."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+def _rfc3339(ms: int) -> str:
+    return datetime.datetime.fromtimestamp(ms / 1000, datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
 class GoogleFitClient:
-    def __init__(self, access_token: str, refresh_token: str = None, expires_at=None):
-        self.creds = Credentials(
-            token=access_token,
-            refresh_token=refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=settings.GOOGLE_CLIENT_ID,
-            client_secret=settings.GOOGLE_CLIENT_SECRET,
-            expiry=expires_at
+    """Cliente assíncrono da API Fitness sobre o pool HTTP compartilhado.
+
+    Leve de construir (um por usuário/requisição): só guarda o access token, que já
+    chega válido do TokenManager. Toda chamada passa pelo disjuntor do endpoint, tem
+    prazo próprio e é repetida com backoff em 429/5xx enquanto couber em `deadline`
+    (instante de time.monotonic(), ex.: o orçamento de um relatório).
+    """
+
+    def __init__(
+        self, access_token: str, client: httpx.AsyncClient = None,
+        deadline: Optional[float] = None, max_attempts: int = None,
+    ):
+        self.access_token = access_token
+        self.client = client or get_http_client()
+        self.deadline = deadline
+        self.max_attempts = max_attempts or settings.FIT_MAX_ATTEMPTS
+
+    def _call_timeout(self, endpoint: str) -> float:
+        if self.deadline is None:
+            return settings.FIT_CALL_TIMEOUT
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise FitTimeoutError(endpoint)
+        return min(settings.FIT_CALL_TIMEOUT, remaining)
+
+    async def _send(self, method: str, path: str, **kwargs) -> dict:
+        resp = await self.client.request(
+            method, f"{BASE_URL}/{path}", headers={"Authorization": f"Bearer {self.access_token}"}, **kwargs
         )
-        # Inicializa o serviço da API Fitness
-        self.service = build('fitness', 'v1', credentials=self.creds)
-
-    def refresh_user_token(self):
-       #Atualiza o token de acesso se ele estiver expirado
-        if self.creds and self.creds.expired and self.creds.refresh_token:
-            logger.info("Token expirado, tentando atualizar...")
-            self.creds.refresh(Request())
-            return self.creds
-        return None
+        if resp.status_code >= 400:
+            raise GoogleFitError(resp.status_code, resp.text, _parse_retry_after(resp.headers.get("Retry-After")))
+        return resp.json()
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        endpoint = path.split("/", 1)[0]
+        breaker = breaker_for(endpoint)
+        attempts = 0
+        while True:
+            attempts += 1
+            # Orçamento esgotado não é culpa do Google: falha antes de passar pelo disjuntor
+            timeout = self._call_timeout(endpoint)
+            if not breaker.allow():
+                FAILURES.labels("google_fit", "circuit_open").inc()
+                raise FitCircuitOpenError(endpoint, breaker.retry_after)
+            try:
+                data = await asyncio.wait_for(self._send(method, path, **kwargs), timeout)
+                breaker.record_success()
+                return data
+            except asyncio.TimeoutError:
+                if timeout < settings.FIT_CALL_TIMEOUT:
+                    # Prazo cortado pelo orçamento de quem chamou: não diz nada sobre o Google
+                    breaker.release_probe()
+                    raise FitTimeoutError(endpoint)
+                error = FitTimeoutError(endpoint)
+            except httpx.TransportError as e:
+                error = e
+            except GoogleFitError as e:
+                if not e.retryable:
+                    # 4xx é problema do pedido/usuário, não do Google: não conta para o disjuntor
+                    breaker.record_success()
+                    raise
+                error = e
+            except BaseException:
+                # Cancelamento ou erro inesperado: sem veredito sobre o Google, só libera o teste
+                breaker.release_probe()
+                raise
+
+            breaker.record_failure()
+            FAILURES.labels("google_fit", getattr(error, "status_code", type(error).__name__)).inc()
+            delay = getattr(error, "retry_after", None) or (
+                settings.FIT_RETRY_BASE_SECONDS * 2 ** (attempts - 1) * random.uniform(1, 2)
+            )
+            out_of_time = self.deadline is not None and time.monotonic() + delay >= self.deadline
+            if attempts >= self.max_attempts or out_of_time:
+                raise error
+            RETRIES.labels("google_fit").inc()
+            logger.warning(f"⚠️ Google Fit {endpoint}: nova tentativa em {delay:.1f}s ({error})")
+            await asyncio.sleep(delay)
+
+    async def aggregate(self, request: AggregateRequest) -> list:
+        """dataset:aggregate; devolve os buckets com um dataset por fonte pedida."""
+        data = await self._request("POST", "dataset:aggregate", json=request.to_json())
+        return [Bucket.from_json(bucket) for bucket in data.get("bucket", [])]
+
+    async def list_data_sources(self, data_type_names) -> list:
+        """dataSources.list filtrado pelos tipos pedidos (só os que os escopos do token alcançam)."""
+        data = await self._request("GET", "dataSources", params=[("dataTypeName", name) for name in data_type_names])
+        return [DataSource.from_json(source) for source in data.get("dataSource", [])]
 
-    def get_daily_steps(self, start_time_ms: int, end_time_ms: int):
-        #Busca o total de passos no intervalo de tempo
-        body = {
-            "aggregateBy": [{"dataTypeName": "com.google.step_count.delta"}],
-            "bucketByTime": {"durationMillis": end_time_ms - start_time_ms},
-            "startTimeMillis": start_time_ms,
-            "endTimeMillis": end_time_ms
-        }
-        
-        response = self.service.users().dataset().aggregate(userId='me', body=body).execute()
-        
-        steps = 0
-        for bucket in response.get('bucket', []):
-            for dataset in bucket.get('dataset', []):
-                for point in dataset.get('point', []):
-                    for value in point.get('value', []):
-                        steps += value.get('intVal', 0)
-        return steps
\ No newline at end of file
+    async def get_sleep_sessions(self, start_time_ms: int, end_time_ms: int) -> list:
+        """Sessões de sono (activityType 72) no intervalo, seguindo a paginação."""
+        sessions, page_token = [], None
+        while True:
+            params = {
+                "startTime": _rfc3339(start_time_ms),
+                "endTime": _rfc3339(end_time_ms),
+                "activityType": SLEEP_ACTIVITY_TYPE,
+            }
+            if page_token:
+                params["pageToken"] = page_token
+            data = await self._request("GET", "sessions", params=params)
+            sessions += [SleepSession.from_json(s) for s in data.get("session", [])]
+            page_token = data.get("nextPageToken")
+            if not page_token or not data.get("session"):
+                return sessions
@@ -0,0 +1,51 @@
+import logging
+import httpx
+from src.config.settings import settings
+from src.services.metrics import InstrumentedTransport
+
+logger = logging.getLogger("mensageiro-fit")
+
+# Cliente HTTP único do processo: reaproveita conexões TCP/TLS entre chamadas
+_client = None
+_transport = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Retorna o AsyncClient compartilhado, criando-o no primeiro uso."""
+    global _client, _transport
+    if _client is None or _client.is_closed:
+        # O transport mede cada chamada (serviço, endpoint, status) para o /metrics
+        _transport = InstrumentedTransport(
+            http2=settings.HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _client = httpx.AsyncClient(
+            transport=_transport,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        )
+        logger.info(
+            f"🌐 Pool HTTP criado (max={settings.HTTP_MAX_CONNECTIONS}, "
+            f"keepalive={settings.HTTP_MAX_KEEPALIVE_CONNECTIONS}, http2={settings.HTTP2_ENABLED})"
+        )
+    return _client
+
+async def close_http_client():
+    """Fecha o cliente compartilhado e todas as conexões do pool."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("🌐 Pool HTTP encerrado.")
+    _client = None
+
+def pool_stats() -> dict:
+    """Uso do pool: requisições em andamento (contadas no transport) e o limite de conexões.
+
+    Acima de max_connections, o excedente está esperando conexão livre.
+    """
+    return {
+        "in_flight": _transport.in_flight if _transport is not None else 0,
+        "max_connections": settings.HTTP_MAX_CONNECTIONS,
+    }
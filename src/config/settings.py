@@ -10,20 +10,145 @@ class Settings(BaseSettings):
     DB_PORT: str
     DB_NAME: str
 
+    # Pool do engine assíncrono (bot, jobs, tokens)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    # Abaixo do wait_timeout do MariaDB: conexões ociosas entre os jobs são trocadas antes do "gone away"
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Pool do engine síncrono (migrações, job store do APScheduler, auth_setup)
+    DB_SYNC_POOL_SIZE: int = 5
+    DB_SYNC_MAX_OVERFLOW: int = 5
+
+    # Réplica de leitura (opcional) para analytics, exportações e gráficos; mesmo usuário e banco
+    DB_REPLICA_HOST: Optional[str] = None
+    DB_REPLICA_PORT: Optional[str] = None
+
     # Configurações do Telegram
     TELEGRAM_BOT_TOKEN: str
+    TELEGRAM_WORKERS: int = 30
+    TELEGRAM_GLOBAL_RATE: float = 30.0
+    TELEGRAM_PER_CHAT_RATE: float = 1.0
+    TELEGRAM_MAX_ATTEMPTS: int = 5
+    TELEGRAM_RETRY_BASE_SECONDS: float = 1.0
+    TELEGRAM_UPDATE_CONCURRENCY: int = 40
+
+    # Webhook do Telegram (opcional): sem URL pública o bot usa polling
+    TELEGRAM_WEBHOOK_URL: Optional[str] = None
+    TELEGRAM_WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8443
+    WEBHOOK_PATH: str = "/telegram/webhook"
 
     # Configurações do Google OAuth
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
     USER_EMAIL: str
 
+    # Configurações do job de relatório diário (fan-out por usuário)
+    REPORT_CONCURRENCY: int = 20
+    REPORT_USER_TIMEOUT: float = 60.0
+    DEFAULT_TIMEZONE: str = "America/Sao_Paulo"
+    REPORT_SLOT_MINUTES: int = 5
+    # Folga no fim do slot (além de REPORT_USER_TIMEOUT) para a fila do Telegram entregar
+    REPORT_SLOT_SLACK_SECONDS: float = 30.0
+    REPORT_CACHE_TTL_SECONDS: float = 300.0
+    REPORT_CACHE_MAX_ENTRIES: int = 10000
+    # Meta diária de passos (sequências nos agregados semanais/mensais)
+    DAILY_STEP_GOAL: int = 8000
+
+    # Gráficos de tendência (/grafico e resumo semanal opcional), renderizados num pool de processos
+    CHART_WORKERS: int = 2
+    CHART_CACHE_MAX_ENTRIES: int = 500
+    CHART_DEFAULT_DAYS: int = 30
+    CHART_MAX_DAYS: int = 365
+    CHART_WEEKLY_DIGEST: bool = False
+    CHART_DIGEST_DAYS: int = 28
+    # Dia e hora do resumo semanal, no DEFAULT_TIMEZONE
+    CHART_DIGEST_DAY: str = "sun"
+    CHART_DIGEST_HOUR: int = 10
+
+    # Resiliência das chamadas ao Google Fit (retentativas, disjuntor e prazos)
+    FIT_CALL_TIMEOUT: float = 8.0
+    FIT_MAX_ATTEMPTS: int = 3
+    FIT_RETRY_BASE_SECONDS: float = 0.5
+    FIT_BREAKER_FAILURES: int = 5
+    FIT_BREAKER_RESET_SECONDS: float = 30.0
+    # Tempo total de Google Fit por relatório; o que não chegar vira métrica "indisponível"
+    REPORT_FIT_BUDGET_SECONDS: float = 20.0
+
+    # Sharding do agendador entre réplicas (1 = uma única instância processa todos)
+    SCHEDULER_SHARDS: int = 1
+    SCHEDULER_LEASE_SECONDS: int = 120
+    INSTANCE_ID: Optional[str] = None
+
+    # Jobs persistidos no banco, recuperação após queda e encerramento gracioso
+    # Slots perdidos até esse limite são entregues no próximo slot (ou no restart)
+    SCHEDULER_CATCHUP_HOURS: int = 6
+    SCHEDULER_MISFIRE_GRACE_SECONDS: int = 3600
+    SHUTDOWN_TIMEOUT_SECONDS: float = 60.0
+
+    # Fontes de dados do Google Fit por usuário (dataSources.list), renovadas em segundo plano
+    FIT_SOURCE_TTL_HOURS: int = 24
+    # Descoberta que falhou: agrega pelo tipo e só tenta de novo depois desse intervalo
+    FIT_SOURCE_RETRY_MINUTES: int = 10
+
+    # Sincronização incremental do Google Fit (pontos granulares + watermark)
+    # A cada intervalo, pré-sincroniza quem recebe o relatório até a rodada seguinte
+    SYNC_INTERVAL_MINUTES: int = 30
+    SYNC_BUCKET_MINUTES: int = 15
+    SYNC_OVERLAP_MINUTES: int = 60
+    SYNC_CONCURRENCY: int = 10
+
+    # Backfill de histórico do Google Fit
+    BACKFILL_CHUNK_DAYS: int = 30
+    BACKFILL_CONCURRENCY: int = 8
+    BACKFILL_REQUESTS_PER_SECOND: float = 5.0
+    BACKFILL_MAX_ATTEMPTS: int = 5
+
+    # Cache e renovação de tokens OAuth do Google
+    TOKEN_REFRESH_MARGIN_SECONDS: int = 300
+    TOKEN_PROACTIVE_REFRESH_SECONDS: int = 900
+    # Só tokens usados (ou esperados num slot próximo) nessa janela são renovados antes de vencer
+    TOKEN_KEEP_WARM_SECONDS: int = 3600
+    TOKEN_MAINTENANCE_INTERVAL_SECONDS: int = 60
+
+    # Pool HTTP compartilhado (Google Fit, OAuth e Telegram)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 40
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_TIMEOUT: float = 15.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP2_ENABLED: bool = True
+
+    # Observabilidade: endpoint /metrics (Prometheus) e dumps do cProfile por job
+    METRICS_ENABLED: bool = True
+    METRICS_PORT: int = 9100
+    PROFILE_JOBS: bool = False
+    PROFILE_DIR: str = "profiles"
+
     # Monta a URL de conexão automaticamente
     @computed_field
     @property
     def DATABASE_URL(self) -> str:
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    # URL do driver assíncrono (aiomysql) para o mesmo banco
+    @computed_field
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+    # URL assíncrona da réplica de leitura; None = leituras vão para o primário
+    @computed_field
+    @property
+    def ASYNC_REPLICA_DATABASE_URL(self) -> Optional[str]:
+        if not self.DB_REPLICA_HOST:
+            return None
+        port = self.DB_REPLICA_PORT or self.DB_PORT
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_REPLICA_HOST}:{port}/{self.DB_NAME}"
+
     # Permite ler de um arquivo .env local se existir, 
     # mas prioriza as variáveis de ambiente do Portainer
     model_config = SettingsConfigDict(
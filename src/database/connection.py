@@ -1,16 +1,110 @@
+from contextlib import asynccontextmanager, contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from src.config.settings import settings
+from src.services.metrics import instrument_engine, timed_pool_class, watch_pool
 
-engine = create_engine(settings.DATABASE_URL)
+def _pool_options(role: str, base_pool, pool_size: int, max_overflow: int) -> dict:
+    return {
+        "poolclass": timed_pool_class(base_pool, role),
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+def build_engine(url: str):
+    """Engine síncrono; no SQLite (testes e benchmarks) o pool padrão é mantido."""
+    if url.startswith("sqlite"):
+        return create_engine(url)
+    engine = create_engine(url, **_pool_options("sync", QueuePool, settings.DB_SYNC_POOL_SIZE, settings.DB_SYNC_MAX_OVERFLOW))
+    watch_pool(engine, "sync", settings.DB_SYNC_MAX_OVERFLOW)
+    return engine
+
+def build_async_engine(url: str, role: str = "primary"):
+    """Cria o engine assíncrono; no SQLite (testes com aiosqlite) o pool padrão é mantido."""
+    if url.startswith("sqlite"):
+        return create_async_engine(url)
+    engine = create_async_engine(
+        url, **_pool_options(role, AsyncAdaptedQueuePool, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+    )
+    watch_pool(engine.sync_engine, role, settings.DB_MAX_OVERFLOW)
+    return engine
+
+engine = build_engine(settings.DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Engine assíncrono usado pelo código que roda no event loop (bot, jobs, tokens)
+async_engine = build_async_engine(settings.ASYNC_DATABASE_URL)
+
+# Histogramas de duração das consultas nos dois engines
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# Leituras pesadas (analytics, exportações, gráficos) vão para a réplica quando configurada.
+# Sem réplica é o mesmo sessionmaker: quem reconfigura AsyncSessionLocal (benchmarks) cobre os dois.
+if settings.ASYNC_REPLICA_DATABASE_URL:
+    replica_engine = build_async_engine(settings.ASYNC_REPLICA_DATABASE_URL, role="replica")
+    instrument_engine(replica_engine.sync_engine)
+    AsyncReadSessionLocal = async_sessionmaker(bind=replica_engine, autoflush=False, expire_on_commit=False)
+else:
+    replica_engine = None
+    AsyncReadSessionLocal = AsyncSessionLocal
+
 Base = declarative_base()
 
-def get_db():
+@contextmanager
+def session_scope():
+    """Sessão síncrona com commit no sucesso, rollback no erro e close sempre."""
     db = SessionLocal()
     try:
         yield db
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@asynccontextmanager
+async def db_session(read_only: bool = False):
+    """Sessão assíncrona do primário ou, com `read_only`, da réplica de leitura (se houver).
+
+    O commit fica com quem chama; ao sair a sessão é fechada e o que não foi confirmado é desfeito.
+    Use a réplica só para leituras que toleram o atraso de replicação.
+    """
+    factory = AsyncReadSessionLocal if read_only else AsyncSessionLocal
+    async with factory() as db:
+        yield db
+
+async def dispose_engines():
+    """Fecha os pools assíncronos (primário e réplica) no encerramento."""
+    await async_engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+def db_pool_stats() -> dict:
+    """Uso dos pools (em uso, ociosas, overflow) por engine, para os logs dos jobs."""
+    engines = {"primary": async_engine.sync_engine, "sync": engine}
+    if replica_engine is not None:
+        engines["replica"] = replica_engine.sync_engine
+    stats = {}
+    for role, current in engines.items():
+        pool = current.pool
+        if hasattr(pool, "checkedout"):
+            stats[role] = {"checked_out": pool.checkedout(), "idle": pool.checkedin(), "overflow": max(pool.overflow(), 0)}
+    return stats
+
+def get_db():
+    with session_scope() as db:
+        yield db
+
+async def get_async_db():
+    async with db_session() as db:
+        yield db
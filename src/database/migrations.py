@@ -0,0 +1,77 @@
+import logging
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import Session
+from src.config.settings import settings
+from src.database.connection import engine, Base
+from src.database.upserts import refresh_rollups_sync
+from src.models import health_metric  # noqa: F401  (registra as tabelas no Base)
+from src.models.health_metric import HealthMetric, MetricRollup
+
+logger = logging.getLogger("mensageiro-fit")
+
+# create_all só cria tabelas novas; colunas e índices novos em tabelas
+# existentes entram aqui como passos idempotentes, em ordem.
+
+def _add_column(conn, table, column, ddl):
+    columns = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        logger.info(f"🛠️ Migração: adicionando {table}.{column}")
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def _add_index(conn, table, name, columns, unique=False):
+    indexes = {i["name"] for i in inspect(conn).get_indexes(table)}
+    if name not in indexes:
+        logger.info(f"🛠️ Migração: criando índice {name}")
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
+
+def _users_delivery_schedule(conn):
+    # O SQLite guarda TIME como texto no formato do SQLAlchemy (com microssegundos)
+    default_time = "21:00:00.000000" if conn.dialect.name == "sqlite" else "21:00:00"
+    _add_column(conn, "users", "report_time", f"TIME NOT NULL DEFAULT '{default_time}'")
+    _add_column(conn, "users", "timezone", f"VARCHAR(64) NOT NULL DEFAULT '{settings.DEFAULT_TIMEZONE}'")
+    _add_index(conn, "users", "ix_users_timezone_report_time", ["timezone", "report_time"])
+
+def _health_metrics_unique_day(conn):
+    indexes = {i["name"] for i in inspect(conn).get_indexes("health_metrics")}
+    indexes |= {c["name"] for c in inspect(conn).get_unique_constraints("health_metrics")}
+    if "uq_health_metrics_user_date" in indexes:
+        return
+    # Versões antigas inseriam uma linha por execução do relatório: fica a mais recente de cada dia
+    result = conn.execute(text(
+        "DELETE FROM health_metrics WHERE id NOT IN ("
+        " SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM health_metrics GROUP BY user_id, date) AS latest"
+        ")"
+    ))
+    logger.info(f"🛠️ Migração: {result.rowcount} linhas duplicadas removidas de health_metrics")
+    _add_index(conn, "health_metrics", "uq_health_metrics_user_date", ["user_id", "date"], unique=True)
+
+def _metric_rollups_initial(conn):
+    # Daqui em diante os upserts mantêm os agregados; o histórico existente entra uma vez
+    if conn.execute(select(MetricRollup.user_id).limit(1)).first():
+        return
+    db = Session(bind=conn)
+    user_ids = conn.execute(select(HealthMetric.user_id).distinct()).scalars().all()
+    for user_id in user_ids:
+        days = conn.execute(select(HealthMetric.date).where(HealthMetric.user_id == user_id)).scalars().all()
+        refresh_rollups_sync(db, [{"user_id": user_id, "date": day} for day in days])
+    if user_ids:
+        logger.info(f"🛠️ Migração: agregados semanais/mensais calculados para {len(user_ids)} usuários")
+
+def _users_last_report(conn):
+    _add_column(conn, "users", "last_report_at", "DATETIME NULL")
+
+MIGRATIONS = [
+    _users_delivery_schedule,
+    _health_metrics_unique_day,
+    _metric_rollups_initial,
+    _users_last_report,
+]
+
+def run_migrations(bind=None):
+    """Cria tabelas ausentes e aplica as migrações pendentes (seguro rodar a cada start)."""
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        for migration in MIGRATIONS:
+            migration(conn)
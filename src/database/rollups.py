@@ -0,0 +1,107 @@
+import datetime
+from collections import defaultdict
+from sqlalchemy import select, and_, or_, tuple_
+from src.config.settings import settings
+from src.models.health_metric import HealthMetric, MetricRollup
+
+PERIODS = ("week", "month")
+ROLLUP_FIELDS = (
+    "days", "steps_total", "steps_min", "steps_max",
+    "sleep_days", "sleep_total", "sleep_min", "sleep_max",
+    "heart_rate_days", "heart_rate_total", "heart_rate_min", "heart_rate_max",
+    "goal_days", "best_streak", "updated_at",
+)
+
+def period_start(period: str, day: datetime.date) -> datetime.date:
+    """Primeiro dia da semana (segunda) ou do mês que contém `day`."""
+    if period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def period_end(period: str, start: datetime.date) -> datetime.date:
+    """Dia seguinte ao último do período (limite exclusivo)."""
+    if period == "week":
+        return start + datetime.timedelta(days=7)
+    return (start + datetime.timedelta(days=32)).replace(day=1)
+
+def previous_period_start(period: str, start: datetime.date) -> datetime.date:
+    return period_start(period, start - datetime.timedelta(days=1))
+
+def affected_periods(rows):
+    """Chaves (user_id, period, period_start) tocadas por um lote de linhas diárias."""
+    return {
+        (row["user_id"], period, period_start(period, row["date"]))
+        for row in rows for period in PERIODS
+    }
+
+def daily_rows_query(periods):
+    """Linhas diárias que cobrem os períodos afetados: um intervalo de datas por usuário."""
+    ranges = {}
+    for user_id, period, start in periods:
+        low, high = ranges.get(user_id, (start, period_end(period, start)))
+        ranges[user_id] = (min(low, start), max(high, period_end(period, start)))
+    return select(
+        HealthMetric.user_id, HealthMetric.date, HealthMetric.steps,
+        HealthMetric.sleep_hours, HealthMetric.heart_rate_avg,
+    ).where(or_(*(
+        and_(HealthMetric.user_id == user_id, HealthMetric.date >= low, HealthMetric.date < high)
+        for user_id, (low, high) in ranges.items()
+    )))
+
+def _summarize(days):
+    """Agrega as linhas diárias (ordenadas por data) de um período."""
+    steps = [d.steps for d in days if d.steps is not None]
+    sleep = [d.sleep_hours for d in days if d.sleep_hours]  # 0 = sono não registrado
+    heart = [d.heart_rate_avg for d in days if d.heart_rate_avg is not None]
+
+    goal_days = best_streak = streak = 0
+    previous = None
+    for d in days:
+        if (d.steps or 0) >= settings.DAILY_STEP_GOAL:
+            goal_days += 1
+            consecutive = previous is not None and d.date - previous == datetime.timedelta(days=1)
+            streak = streak + 1 if consecutive else 1
+            best_streak = max(best_streak, streak)
+            previous = d.date
+        else:
+            streak, previous = 0, None
+
+    return {
+        "days": len(steps),
+        "steps_total": sum(steps),
+        "steps_min": min(steps, default=None),
+        "steps_max": max(steps, default=None),
+        "sleep_days": len(sleep),
+        "sleep_total": round(sum(sleep), 2),
+        "sleep_min": min(sleep, default=None),
+        "sleep_max": max(sleep, default=None),
+        "heart_rate_days": len(heart),
+        "heart_rate_total": sum(heart),
+        "heart_rate_min": min(heart, default=None),
+        "heart_rate_max": max(heart, default=None),
+        "goal_days": goal_days,
+        "best_streak": best_streak,
+        "updated_at": datetime.datetime.utcnow(),
+    }
+
+def build_rollups(periods, daily_rows):
+    """Recalcula cada período afetado a partir das suas (até 31) linhas diárias."""
+    by_user = defaultdict(list)
+    for row in sorted(daily_rows, key=lambda r: r.date):
+        by_user[row.user_id].append(row)
+
+    rollups = []
+    for user_id, period, start in periods:
+        end = period_end(period, start)
+        days = [d for d in by_user[user_id] if start <= d.date < end]
+        if days:
+            rollups.append({"user_id": user_id, "period": period, "period_start": start, **_summarize(days)})
+    return rollups
+
+def rollups_query(user_id: int, period: str, starts):
+    """Busca direta pela chave primária: ex.: semana atual e anterior numa só consulta."""
+    return select(MetricRollup).where(
+        tuple_(MetricRollup.user_id, MetricRollup.period, MetricRollup.period_start).in_(
+            [(user_id, period, start) for start in starts]
+        )
+    )
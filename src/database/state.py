@@ -0,0 +1,20 @@
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database.upserts import upsert_statement
+from src.models.health_metric import SchedulerState
+
+async def load_state(db: AsyncSession, keys) -> dict:
+    """Valores gravados para `keys`; chaves ausentes não aparecem no resultado."""
+    result = await db.execute(select(SchedulerState.key, SchedulerState.value).where(SchedulerState.key.in_(list(keys))))
+    return dict(result.all())
+
+async def save_state(db: AsyncSession, values: dict):
+    """Grava {chave: valor} com upsert (o commit fica com quem chamou)."""
+    if not values:
+        return
+    now = datetime.utcnow()
+    batch = [{"key": key, "value": str(value), "updated_at": now} for key, value in values.items()]
+    await db.execute(upsert_statement(
+        db.bind.dialect.name, SchedulerState.__table__, batch, ["key"], ("value", "updated_at"),
+    ))
@@ -0,0 +1,95 @@
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from src.database.rollups import ROLLUP_FIELDS, affected_periods, build_rollups, daily_rows_query
+from src.models.health_metric import HealthMetric, MetricRollup
+
+METRIC_FIELDS = ("steps", "sleep_hours", "heart_rate_avg")
+BATCH_SIZE = 1000
+
+# Chamados com os user_ids após cada upsert de health_metrics (ex.: o cache de relatórios);
+# o SQL de upsert não passa pelos eventos do ORM
+_upsert_listeners = []
+
+def on_health_metrics_upserted(listener):
+    """Registra `listener(user_ids)` para depois de cada upsert_health_metrics (usável como decorador)."""
+    _upsert_listeners.append(listener)
+    return listener
+
+def upsert_statement(dialect_name: str, table, batch, keys, fields):
+    """INSERT ... ON DUPLICATE KEY UPDATE (MariaDB) ou ON CONFLICT (SQLite) para um lote.
+
+    Outro dialeto levanta ValueError: o projeto só roda nesses dois bancos.
+    """
+    if dialect_name in ("mysql", "mariadb"):
+        stmt = mysql.insert(table).values(batch)
+        update = {f: stmt.inserted[f] for f in fields}
+        # Sem campos a atualizar, reatribui a chave só para o INSERT virar no-op
+        return stmt.on_duplicate_key_update(update or {keys[0]: stmt.inserted[keys[0]]})
+    if dialect_name == "sqlite":
+        stmt = sqlite.insert(table).values(batch)
+        if fields:
+            return stmt.on_conflict_do_update(index_elements=keys, set_={f: stmt.excluded[f] for f in fields})
+        return stmt.on_conflict_do_nothing(index_elements=keys)
+    raise ValueError(f"upsert de {table.name} não suportado no dialeto {dialect_name!r} (use MariaDB/MySQL ou SQLite)")
+
+def _upsert_statements(dialect_name: str, rows):
+    """Um statement por lote de linhas diárias.
+
+    Linhas com conjuntos de campos diferentes vão em statements separados, para que
+    um upsert parcial (ex.: só passos) não zere as outras colunas.
+    """
+    groups = {}
+    for row in rows:
+        fields = tuple(f for f in METRIC_FIELDS if f in row)
+        groups.setdefault(fields, []).append(
+            {"user_id": row["user_id"], "date": row["date"], **{f: row[f] for f in fields}}
+        )
+
+    for fields, group in groups.items():
+        for i in range(0, len(group), BATCH_SIZE):
+            yield upsert_statement(
+                dialect_name, HealthMetric.__table__, group[i:i + BATCH_SIZE], ["user_id", "date"], fields
+            )
+
+def _rollup_statements(dialect_name: str, periods, daily_rows):
+    rollups = build_rollups(periods, daily_rows)
+    for i in range(0, len(rollups), BATCH_SIZE):
+        yield upsert_statement(
+            dialect_name, MetricRollup.__table__, rollups[i:i + BATCH_SIZE],
+            ["user_id", "period", "period_start"], ROLLUP_FIELDS,
+        )
+
+def _notify_upserted(rows):
+    user_ids = {row["user_id"] for row in rows}
+    for listener in _upsert_listeners:
+        listener(user_ids)
+
+async def upsert_health_metrics(db: AsyncSession, rows):
+    """Grava linhas diárias {user_id, date, steps?, sleep_hours?, heart_rate_avg?} com upsert em lote.
+
+    Na mesma transação recalcula os agregados semanais/mensais dos períodos tocados.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    dialect_name = db.bind.dialect.name
+    for stmt in _upsert_statements(dialect_name, rows):
+        await db.execute(stmt)
+    await refresh_rollups(db, rows)
+    _notify_upserted(rows)
+    return len(rows)
+
+async def refresh_rollups(db: AsyncSession, rows):
+    """Recalcula as semanas/meses que contêm os dias de `rows` (só esses períodos)."""
+    periods = affected_periods(rows)
+    daily_rows = (await db.execute(daily_rows_query(periods))).all()
+    for stmt in _rollup_statements(db.bind.dialect.name, periods, daily_rows):
+        await db.execute(stmt)
+
+def refresh_rollups_sync(db: Session, rows):
+    """Versão síncrona de refresh_rollups (migração inicial dos agregados)."""
+    periods = affected_periods(rows)
+    daily_rows = db.execute(daily_rows_query(periods)).all()
+    for stmt in _rollup_statements(db.get_bind().dialect.name, periods, daily_rows):
+        db.execute(stmt)
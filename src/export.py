@@ -0,0 +1,45 @@
+import argparse
+import asyncio
+import json
+import logging
+from datetime import date, timedelta
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("mensageiro-fit")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exporta o histórico de saúde de um usuário e calcula estatísticas.")
+    parser.add_argument("--user-id", type=int, required=True, help="usuário a exportar")
+    parser.add_argument("--days", type=int, default=None, help="quantos dias para trás (padrão: todo o histórico)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="último dia (padrão: hoje)")
+    parser.add_argument("--parquet", help="grava o histórico neste arquivo Parquet")
+    parser.add_argument("--points", action="store_true", help="no Parquet, exporta os pontos granulares em vez dos dias")
+    parser.add_argument("--npz", help="grava as colunas diárias neste arquivo .npz")
+    parser.add_argument("--window", type=int, default=7, help="janela da média móvel em dias (padrão: 7)")
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    # Banco, Settings e NumPy só carregam depois dos argumentos: --help e erros de uso saem na hora
+    from src.database.connection import dispose_engines
+    from src.services import analytics
+
+    end = args.end or (date.today() if args.days else None)
+    start = end - timedelta(days=args.days - 1) if args.days else None
+    try:
+        if args.parquet:
+            dataset = "points" if args.points else "daily"
+            rows = await analytics.export_parquet(args.user_id, args.parquet, dataset, start, end)
+            logger.info(f"📦 {rows} linhas ({dataset}) gravadas em {args.parquet}")
+
+        history = await analytics.load_daily_history(args.user_id, start, end)
+        if args.npz:
+            analytics.save_npz(history, args.npz)
+            logger.info(f"📦 {len(history)} dias gravados em {args.npz}")
+        print(json.dumps(analytics.summarize(history, args.window), ensure_ascii=False, indent=2))
+    finally:
+        await dispose_engines()
+
+if __name__ == "__main__":
+    # Lembre-se de rodar: set PYTHONPATH=. antes de executar
+    asyncio.run(main())
@@ -1,90 +1,439 @@
 import asyncio
 import logging
-from datetime import datetime
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from src.services.health_service import HealthService
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from src.services.token_manager import token_manager
+from src.services.telegram_queue import telegram_queue
+from src.services.report_cache import report_cache
+from src.services.chart_service import chart_service
+from src.services.data_source_service import data_source_resolver
+from src.services.scheduler_service import (
+    delivery_scheduler, drain_jobs, jitter_seconds, shutdown_event, slot_bounds, start_scheduler, tracked_job,
+)
+from src.services.metrics import (
+    FAILURES, POLLER_OFFSET, REPORT_SECONDS, SCHEDULER_LAG, instrumented_job, start_metrics_server,
+)
+from src.database.migrations import run_migrations
+from src.services.telegram_dispatcher import dispatcher
+from src.services.telegram_webhook import start_webhook_server, register_webhook, delete_webhook
 from src.config.settings import settings
-from src.database.connection import SessionLocal
-from src.models.health_metric import User
+from src.clients.http_client import get_http_client, close_http_client, pool_stats
+from sqlalchemy import select, update
+from src.database.connection import db_pool_stats, db_session, dispose_engines
+from src.database.state import load_state, save_state
+from src.models.health_metric import User, OAuthToken
 import httpx
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("mensageiro-fit")
 
-async def send_telegram_message(chat_id, text):
-    """Envia mensagem para um chat_id específico."""
-    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
-    async with httpx.AsyncClient() as client:
-        await client.post(url, json=payload)
+POLL_OFFSET_KEY = "telegram_update_offset"
+
+async def send_telegram_message(chat_id, text, parse_mode="Markdown"):
+    """Envia mensagem para um chat_id específico pela fila de entrega; retorna se foi entregue."""
+    return await telegram_queue.send(chat_id, text, parse_mode)
 
 async def register_user_chat_id(chat_id):
     """Salva o chat_id do Telegram no banco para o e-mail configurado."""
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter_by(email=settings.USER_EMAIL).first()
+    async with db_session() as db:
+        result = await db.execute(select(User).filter_by(email=settings.USER_EMAIL))
+        user = result.scalars().first()
         if user:
             user.telegram_chat_id = str(chat_id)
-            db.commit()
+            await db.commit()
             logger.info(f"✅ Chat ID {chat_id} vinculado ao usuário {settings.USER_EMAIL}")
             return True
         logger.warning(f"⚠️ Usuário {settings.USER_EMAIL} não encontrado no banco para vincular ID.")
         return False
-    finally:
-        db.close()
 
-async def handle_updates():
-    """Loop que 'ouve' o Telegram para capturar o /start."""
-    last_update_id = 0
+@dispatcher.command("/start")
+async def handle_start(message):
+    """Vincula o chat ao usuário configurado e confirma no Telegram."""
+    chat_id = message["chat"]["id"]
+    if await register_user_chat_id(chat_id):
+        await send_telegram_message(chat_id, "✅ *Conectado!* Seu ID foi registrado e você receberá os relatórios aqui.")
+    else:
+        await send_telegram_message(chat_id, "❌ Erro: Seu e-mail não foi pré-cadastrado no sistema.")
+
+@dispatcher.command("/hoje")
+async def handle_today(message):
+    """Envia o relatório do dia sob demanda (servido do cache quando recente)."""
+    chat_id = message["chat"]["id"]
+    async with db_session() as db:
+        result = await db.execute(select(User.id).where(User.telegram_chat_id == str(chat_id)))
+        user_id = result.scalar()
+    if user_id is None:
+        await send_telegram_message(chat_id, "⚠️ Chat não vinculado. Envie /start primeiro.")
+        return
+    # Os serviços do Google Fit carregam no primeiro uso: o polling sobe sem eles
+    from src.services.health_service import HealthService, ReportError
+
+    try:
+        report_text = await HealthService().generate_daily_report(user_id)
+    except ReportError as e:
+        report_text = str(e)
+    await send_telegram_message(chat_id, report_text)
+
+@dispatcher.command("/horario")
+async def handle_schedule(message):
+    """Ajusta o horário local de entrega e, opcionalmente, o fuso: /horario 07:30 America/Recife."""
+    chat_id = message["chat"]["id"]
+    args = message.get("text", "").split()[1:]
+    try:
+        report_time = datetime.strptime(args[0], "%H:%M").time()
+        tz_name = args[1] if len(args) > 1 else None
+        if tz_name:
+            ZoneInfo(tz_name)
+    except (IndexError, ValueError, KeyError):
+        await send_telegram_message(chat_id, "⚠️ Uso: /horario HH:MM [fuso], ex.: /horario 07:30 America/Recife")
+        return
+
+    async with db_session() as db:
+        result = await db.execute(select(User).where(User.telegram_chat_id == str(chat_id)))
+        user = result.scalars().first()
+        if not user:
+            await send_telegram_message(chat_id, "⚠️ Chat não vinculado. Envie /start primeiro.")
+            return
+        user.report_time = report_time
+        if tz_name:
+            user.timezone = tz_name
+        await db.commit()
+        tz_name = user.timezone
+    # Texto puro: nomes de fuso têm "_" (America/Sao_Paulo), que o Markdown leria como itálico aberto
+    await send_telegram_message(chat_id, f"⏰ Relatório diário agendado para {report_time:%H:%M} ({tz_name}).", parse_mode=None)
+
+@dispatcher.command("/grafico")
+async def handle_chart(message):
+    """Envia o gráfico de tendência dos últimos N dias: /grafico [dias] (padrão 30)."""
+    chat_id = message["chat"]["id"]
+    args = message.get("text", "").split()[1:]
+    try:
+        days = int(args[0]) if args else settings.CHART_DEFAULT_DAYS
+        if not 2 <= days <= settings.CHART_MAX_DAYS:
+            raise ValueError(days)
+    except ValueError:
+        await send_telegram_message(chat_id, f"⚠️ Uso: /grafico [dias], entre 2 e {settings.CHART_MAX_DAYS}, ex.: /grafico 90")
+        return
+
+    async with db_session() as db:
+        result = await db.execute(select(User.id).where(User.telegram_chat_id == str(chat_id)))
+        user_id = result.scalar()
+    if user_id is None:
+        await send_telegram_message(chat_id, "⚠️ Chat não vinculado. Envie /start primeiro.")
+        return
+    if not await chart_service.send_chart(chat_id, user_id, days, caption=f"📈 *Sua tendência nos últimos {days} dias*"):
+        await send_telegram_message(chat_id, "⚠️ Ainda não há dados suficientes para o gráfico (ou o envio falhou).")
+
+class TelegramPollError(Exception):
+    """getUpdates respondeu erro (ex.: 401 token inválido, 409 webhook ativo, 429)."""
+
+    def __init__(self, status_code: int, description: str, retry_after: float = None):
+        super().__init__(f"getUpdates respondeu {status_code}: {description[:200]}")
+        self.retry_after = retry_after
+
+def _poll_result(resp: httpx.Response) -> list:
+    """Updates de uma resposta do getUpdates; levanta TelegramPollError se não for `ok`."""
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {}
+    if resp.status_code != 200 or not data.get("ok"):
+        retry_after = (data.get("parameters") or {}).get("retry_after")
+        raise TelegramPollError(resp.status_code, data.get("description") or resp.text, retry_after)
+    return data.get("result", [])
+
+async def handle_updates(client: httpx.AsyncClient = None):
+    """Loop que 'ouve' o Telegram via getUpdates (fallback quando não há webhook).
+
+    Cada update roda em segundo plano no dispatcher: um comando lento (ex.: /grafico) não
+    segura o próximo getUpdates nem os outros chats. O offset avança no recebimento e fica
+    no banco: um restart continua de onde parou (o encerramento drena os updates em curso).
+    Erros, inclusive na partida, são repetidos com backoff exponencial.
+    """
+    client = client or get_http_client()
+    poll_timeout = 20
     url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/getUpdates"
-    logger.info("📡 Escutador de mensagens (Polling) iniciado...")
-    
+    last_update_id = None
+    failures = 0
+
     while True:
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(url, params={"offset": last_update_id + 1, "timeout": 20})
-                updates = resp.json().get("result", [])
+            if last_update_id is None:
+                async with db_session() as db:
+                    stored = int((await load_state(db, [POLL_OFFSET_KEY])).get(POLL_OFFSET_KEY, 0))
+                # Um webhook ativo faz o getUpdates responder 409
+                await delete_webhook()
+                last_update_id = stored
+                logger.info("📡 Escutador de mensagens (Polling) iniciado...")
+
+            # O long polling segura a conexão por até poll_timeout segundos
+            resp = await client.get(
+                url,
+                params={"offset": last_update_id + 1, "timeout": poll_timeout},
+                timeout=poll_timeout + settings.HTTP_TIMEOUT,
+            )
+            updates = _poll_result(resp)
+            failures = 0
+            if updates:
+                # Falhas ficam isoladas em cada update
                 for update in updates:
-                    last_update_id = update["update_id"]
-                    msg = update.get("message", {})
-                    if msg.get("text") == "/start":
-                        chat_id = msg["chat"]["id"]
-                        if await register_user_chat_id(chat_id):
-                            await send_telegram_message(chat_id, "✅ *Conectado!* Seu ID foi registrado e você receberá os relatórios aqui.")
-                        else:
-                            await send_telegram_message(chat_id, "❌ Erro: Seu e-mail não foi pré-cadastrado no sistema.")
+                    dispatcher.dispatch_in_background(update)
+                last_update_id = max(update["update_id"] for update in updates)
+                POLLER_OFFSET.set(last_update_id)
+                async with db_session() as db:
+                    await save_state(db, {POLL_OFFSET_KEY: last_update_id})
+                    await db.commit()
         except Exception as e:
-            logger.error(f"Erro no polling: {e}")
-        await asyncio.sleep(2)
+            failures += 1
+            FAILURES.labels("telegram_polling", type(e).__name__).inc()
+            delay = getattr(e, "retry_after", None) or min(2 ** failures, 60)
+            logger.error(f"Erro no polling: {e} (nova tentativa em {delay}s)")
+            await asyncio.sleep(delay)
 
-async def job_daily_report():
-    """Tarefa de relatório."""
-    logger.info(f"🔄 Iniciando busca de dados: {datetime.now()}")
-    service = HealthService()
+async def fetch_report_recipients():
+    """Lista (user_id, chat_id) dos usuários com Telegram vinculado e token OAuth."""
+    query = (
+        select(User.id, User.telegram_chat_id)
+        .join(OAuthToken, OAuthToken.user_id == User.id)
+        .where(User.telegram_chat_id.isnot(None))
+    )
+    async with db_session() as db:
+        return (await db.execute(query)).all()
+
+async def mark_reported(user_id):
+    """Registra a entrega do relatório (usado para não reenviar após um restart)."""
+    async with db_session() as db:
+        await db.execute(update(User).where(User.id == user_id).values(last_report_at=datetime.utcnow()))
+        await db.commit()
+
+async def flush_data_sources():
+    """Grava as fontes do Google Fit descobertas no lote; uma falha só adia a gravação."""
     try:
-        report_text = await service.generate_daily_report()
-        # Busca o chat_id atualizado no banco
-        db = SessionLocal()
-        user = db.query(User).filter_by(email=settings.USER_EMAIL).first()
-        db.close()
-        
-        if user and user.telegram_chat_id:
-            await send_telegram_message(user.telegram_chat_id, report_text)
-            logger.info("✅ Relatório enviado!")
+        await data_source_resolver.flush()
     except Exception as e:
-        logger.error(f"❌ Erro no job: {e}")
+        logger.error(f"❌ Erro ao gravar fontes do Google Fit: {e!r}")
+
+async def deliver_reports(recipients, spread_seconds: float = 0, label: str = "Relatórios"):
+    """Gera e envia relatórios em paralelo, espalhando os inícios por até `spread_seconds`."""
+    started = time.perf_counter()
+    # Uma consulta carrega todos os tokens (e outra as fontes); o resto do lote é servido da memória
+    user_ids = [user_id for user_id, _ in recipients]
+    await token_manager.warm(user_ids)
+    await data_source_resolver.warm(user_ids)
+
+    from src.services.health_service import HealthService
+
+    client = get_http_client()
+    service = HealthService(client)
+    semaphore = asyncio.Semaphore(settings.REPORT_CONCURRENCY)
+
+    async def process(user_id, chat_id):
+        # Cada usuário roda isolado: erro ou lentidão de um não trava o lote
+        try:
+            if spread_seconds:
+                await asyncio.sleep(jitter_seconds(user_id, spread_seconds))
+            async with semaphore:
+                generation_started = time.perf_counter()
+                result = "error"
+                try:
+                    report_text = await asyncio.wait_for(
+                        service.generate_daily_report(user_id), timeout=settings.REPORT_USER_TIMEOUT
+                    )
+                    result = "ok"
+                except asyncio.TimeoutError:
+                    result = "timeout"
+                    raise
+                finally:
+                    REPORT_SECONDS.labels(result).observe(time.perf_counter() - generation_started)
+            # A entrega espera a fila do Telegram sem ocupar uma vaga de geração
+            delivered = await send_telegram_message(chat_id, report_text)
+            if delivered:
+                await mark_reported(user_id)
+            return delivered
+        except Exception as e:
+            FAILURES.labels("report", type(e).__name__).inc()
+            logger.error(f"❌ Erro no relatório do usuário {user_id}: {e!r}")
+            return False
+
+    results = await asyncio.gather(*(process(user_id, chat_id) for user_id, chat_id in recipients))
+    await flush_data_sources()
+
+    failed = results.count(False)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"✅ {label} concluídos: {len(results)} processados, {failed} falhas em {elapsed:.2f}s "
+        f"(concorrência={settings.REPORT_CONCURRENCY}, pool HTTP={pool_stats()}, "
+        f"fila Telegram={telegram_queue.stats()}, cache={report_cache.stats()}, pool DB={db_pool_stats()})"
+    )
+    return {"processed": len(results), "failed": failed, "elapsed": elapsed}
+
+@instrumented_job("delivery_slot")
+@tracked_job
+async def job_delivery_slot():
+    """Tarefa por slot: entrega a quem tem o horário local de relatório neste slot (e neste shard).
+
+    Slots perdidos desde o último concluído (processo fora do ar) entram junto, sem reenviar
+    a quem já recebeu; o watermark só avança quando o lote termina, e só nos shards do lote.
+    """
+    now = datetime.now(timezone.utc)
+    slot_start, slot_end = slot_bounds(now, settings.REPORT_SLOT_MINUTES)
+    SCHEDULER_LAG.set((now - slot_start).total_seconds())
+    await delivery_scheduler.rebalance()
+    # Os shards ficam fixos durante o job: o heartbeat pode trocar owned_shards no meio do lote
+    shards = set(delivery_scheduler.owned_shards)
+    window_start = await delivery_scheduler.pending_since(slot_start, shards)
+    recipients = await delivery_scheduler.due_recipients(window_start, slot_end, shards)
+    result = None
+    if recipients:
+        if window_start < slot_start:
+            logger.info(f"⏪ Recuperando slots perdidos desde {window_start:%H:%M} UTC")
+        logger.info(f"🔄 Slot {slot_start:%H:%M} UTC: {len(recipients)} relatórios a entregar")
+        # Jitter dentro do slot: os envios se espalham em vez de começar todos no mesmo segundo,
+        # mas o último início ainda deixa tempo para gerar e entregar antes do próximo slot
+        # (senão o próximo disparo encontra este em execução e é pulado)
+        remaining = (slot_end - datetime.now(timezone.utc)).total_seconds()
+        spread = max(remaining - settings.REPORT_USER_TIMEOUT - settings.REPORT_SLOT_SLACK_SECONDS, 0)
+        result = await deliver_reports(recipients, spread_seconds=spread, label=f"Relatórios do slot {slot_start:%H:%M}")
+    await delivery_scheduler.mark_delivered(slot_end, shards)
+    await expect_next_slot(slot_end)
+    return result
+
+async def expect_next_slot(slot_start: datetime):
+    """Avisa o TokenManager de quem recebe no próximo slot: os tokens são renovados antes do lote."""
+    try:
+        upcoming = await delivery_scheduler.due_recipients(
+            slot_start, slot_start + timedelta(minutes=settings.REPORT_SLOT_MINUTES)
+        )
+        await token_manager.expect([user_id for user_id, _ in upcoming])
+    except Exception as e:
+        logger.warning(f"⚠️ Não foi possível pré-carregar os tokens do próximo slot: {e!r}")
+
+@instrumented_job("weekly_digest")
+@tracked_job
+async def job_weekly_digest():
+    """Resumo semanal opcional: envia o gráfico das últimas semanas a todos os usuários vinculados."""
+    recipients = await fetch_report_recipients()
+    semaphore = asyncio.Semaphore(settings.REPORT_CONCURRENCY)
+    caption = f"🗓️ *Resumo semanal:* sua tendência nos últimos {settings.CHART_DIGEST_DAYS} dias"
+
+    async def process(user_id, chat_id):
+        async with semaphore:
+            try:
+                return await chart_service.send_chart(chat_id, user_id, settings.CHART_DIGEST_DAYS, caption)
+            except Exception as e:
+                FAILURES.labels("chart", type(e).__name__).inc()
+                logger.error(f"❌ Erro no gráfico semanal do usuário {user_id}: {e!r}")
+                return False
+
+    results = await asyncio.gather(*(process(user_id, chat_id) for user_id, chat_id in recipients))
+    logger.info(f"🗓️ Resumo semanal: {results.count(True)} gráficos enviados de {len(results)} (cache={chart_service.stats()})")
+
+@instrumented_job("incremental_sync")
+@tracked_job
+async def job_incremental_sync():
+    """Pré-sincronização: baixa os pontos novos de quem recebe o relatório até a próxima rodada.
+
+    O relatório sincroniza de novo só o delta desde aqui, dentro do seu orçamento de tempo.
+    Quem não está para receber não é sincronizado (nem tem o token mantido aquecido).
+    """
+    from src.services.google_fit_service import GoogleFitService
+
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    due = await delivery_scheduler.due_recipients(now, now + timedelta(minutes=settings.SYNC_INTERVAL_MINUTES))
+    user_ids = [user_id for user_id, _ in due]
+    if not user_ids:
+        return
+
+    await token_manager.warm(user_ids)
+    await data_source_resolver.warm(user_ids)
+    semaphore = asyncio.Semaphore(settings.SYNC_CONCURRENCY)
+
+    async def process(user_id):
+        async with semaphore:
+            try:
+                access_token = await token_manager.get_token(user_id)
+                if not access_token:
+                    return False
+                metrics = await GoogleFitService().sync_user_data(user_id, access_token)
+                return metrics.complete
+            except Exception as e:
+                logger.error(f"❌ Erro na sincronização do usuário {user_id}: {e!r}")
+                return False
+
+    results = await asyncio.gather(*(process(user_id) for user_id in user_ids))
+    await flush_data_sources()
+    logger.info(
+        f"🔁 Sincronização incremental: {len(results)} usuários, {results.count(False)} falhas "
+        f"em {time.perf_counter() - started:.2f}s"
+    )
+
+async def shutdown(scheduler, poller: asyncio.Task = None, webhook_runner=None):
+    """Encerramento gracioso: para a entrada de trabalho e drena o que está em andamento.
+
+    Ordem: pausa o agendador, fecha a entrada de updates, espera jobs e updates em curso,
+    esvazia a fila do Telegram e só então fecha os pools. O que não terminar em SHUTDOWN_TIMEOUT_SECONDS é retomado no próximo start.
+    """
+    logger.info("🛑 Encerrando: drenando envios e sincronizações em andamento...")
+    if scheduler:
+        scheduler.pause()
+    if poller:
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+    if webhook_runner:
+        await webhook_runner.cleanup()
+    await asyncio.gather(
+        dispatcher.drain(), drain_jobs(settings.SHUTDOWN_TIMEOUT_SECONDS), return_exceptions=True
+    )
+    if scheduler:
+        scheduler.shutdown(wait=False)
+    await delivery_scheduler.release()
+    await telegram_queue.stop(timeout=settings.SHUTDOWN_TIMEOUT_SECONDS)
+    await asyncio.to_thread(chart_service.shutdown)
+    await token_manager.stop()
+    await flush_data_sources()
+    await close_http_client()
+    await dispose_engines()
+    logger.info("👋 Mensageiro Fit encerrado.")
+
+def scheduled_jobs():
+    """Jobs recorrentes [(id, função, gatilho)]; os IDs fixos identificam os jobs persistidos."""
+    from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    jobs = [
+        # Um job por slot; cada usuário recebe no seu horário local (padrão 21:00)
+        ("delivery_slot", job_delivery_slot, CronTrigger(minute=f"*/{settings.REPORT_SLOT_MINUTES}")),
+        ("incremental_sync", job_incremental_sync, IntervalTrigger(minutes=settings.SYNC_INTERVAL_MINUTES)),
+    ]
+    if settings.CHART_WEEKLY_DIGEST:
+        jobs.append(("weekly_digest", job_weekly_digest, CronTrigger(
+            day_of_week=settings.CHART_DIGEST_DAY, hour=settings.CHART_DIGEST_HOUR, timezone=settings.DEFAULT_TIMEZONE,
+        )))
+    return jobs
 
 async def main():
     logger.info("🚀 Servidor Mensageiro Fit Iniciado!")
-    # Inicia o escutador em segundo plano
-    asyncio.create_task(handle_updates())
-    
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(job_daily_report, 'cron', hour=21, minute=0)
-    scheduler.start()
+    stop = shutdown_event()
+    await asyncio.to_thread(run_migrations)
+    start_metrics_server()
+    # Inicia a renovação de tokens, a fila de envio e a entrada de updates (webhook ou polling)
+    token_manager.start()
+    telegram_queue.start()
+    delivery_scheduler.start()
+    webhook_runner = poller = scheduler = None
+    try:
+        if settings.TELEGRAM_WEBHOOK_URL:
+            webhook_runner = await start_webhook_server()
+            await register_webhook()
+        else:
+            poller = asyncio.create_task(handle_updates())
 
-    while True:
-        await asyncio.sleep(1000)
+        scheduler = start_scheduler(scheduled_jobs())
+        await stop.wait()
+    finally:
+        await shutdown(scheduler, poller, webhook_runner)
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,15 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+@dataclass
+class DailyMetrics:
+    """Métricas do dia coletadas do Google Fit em uma única rodada de chamadas."""
+    steps: int = 0
+    heart_rate_avg: Optional[float] = None
+    sleep_hours: Optional[float] = None  # None = sem sessão de sono registrada
+    # Métricas que o Google Fit não entregou a tempo ("steps", "heart_rate", "sleep")
+    missing: set = field(default_factory=set)
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing
@@ -0,0 +1,147 @@
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Optional
+
+# Modelos tipados das requisições e respostas da API Fitness usadas pelo bot
+
+STEPS = "com.google.step_count.delta"
+HEART_RATE = "com.google.heart_rate.bpm"
+# Fonte "estimated_steps": o mesmo total que o app Google Fit mostra
+ESTIMATED_STEPS_SOURCE = "derived:com.google.step_count.delta:com.google.android.gms:estimated_steps"
+MERGED_STEPS_SOURCE = "derived:com.google.step_count.delta:com.google.android.gms:merge_step_deltas"
+MERGED_HEART_RATE_SOURCE = "derived:com.google.heart_rate.bpm:com.google.android.gms:merge_heart_rate_bpm"
+# Fontes preferidas por tipo, em ordem; as fusões do Google Play Services já deduplicam os aparelhos
+PREFERRED_SOURCES = {
+    STEPS: (ESTIMATED_STEPS_SOURCE, MERGED_STEPS_SOURCE),
+    HEART_RATE: (MERGED_HEART_RATE_SOURCE,),
+}
+SLEEP_ACTIVITY_TYPE = 72
+
+@dataclass(frozen=True)
+class AggregateSource:
+    """Uma entrada de aggregateBy: por tipo de dado ou por fonte específica."""
+    data_type_name: Optional[str] = None
+    data_source_id: Optional[str] = None
+
+    def to_json(self) -> dict:
+        if self.data_source_id:
+            return {"dataSourceId": self.data_source_id}
+        return {"dataTypeName": self.data_type_name}
+
+    @classmethod
+    def for_type(cls, data_type_name: str, data_source_id: Optional[str] = None) -> "AggregateSource":
+        """A fonte descoberta para o tipo, ou o tipo inteiro (o Google mescla as fontes) se não houver."""
+        return cls(data_type_name=data_type_name, data_source_id=data_source_id)
+
+@dataclass(frozen=True)
+class DataSource:
+    """Uma fonte de dados do usuário (dataSources.list)."""
+    data_stream_id: str
+    data_type_name: str
+    type: str  # "raw" (aparelho/app) ou "derived" (calculada pelo Google)
+    application: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> "DataSource":
+        return cls(
+            data_stream_id=data["dataStreamId"],
+            data_type_name=data.get("dataType", {}).get("name", ""),
+            type=data.get("type", ""),
+            application=data.get("application", {}).get("packageName"),
+        )
+
+def best_source(data_type_name: str, sources) -> Optional[str]:
+    """Escolhe a fonte mais fiel do tipo entre as do usuário; None = agregar pelo tipo.
+
+    Ordem: fontes preferidas (fusões do Google), depois uma única fonte "raw" (ex.: o
+    único relógio do usuário). Com várias fontes sem fusão, deixa o Google mesclar.
+    """
+    ids = {source.data_stream_id for source in sources if source.data_type_name == data_type_name}
+    for preferred in PREFERRED_SOURCES.get(data_type_name, ()):
+        if preferred in ids:
+            return preferred
+    raw = [s.data_stream_id for s in sources if s.data_type_name == data_type_name and s.type == "raw"]
+    return raw[0] if len(raw) == 1 else None
+
+@dataclass(frozen=True)
+class AggregateRequest:
+    sources: tuple
+    start_ms: int
+    end_ms: int
+    bucket_ms: int
+
+    def to_json(self) -> dict:
+        return {
+            "aggregateBy": [source.to_json() for source in self.sources],
+            "bucketByTime": {"durationMillis": self.bucket_ms},
+            "startTimeMillis": self.start_ms,
+            "endTimeMillis": self.end_ms,
+        }
+
+@dataclass(frozen=True)
+class DataPoint:
+    start_ms: int
+    end_ms: int
+    # intVal ou fpVal de cada campo; para batimentos agregados: [média, máximo, mínimo]
+    values: tuple
+
+    @property
+    def first(self) -> Optional[float]:
+        return self.values[0] if self.values else None
+
+@dataclass
+class Bucket:
+    start_ms: int
+    end_ms: int
+    # Um dataset por entrada de aggregateBy, na mesma ordem
+    datasets: list = field(default_factory=list)
+
+    def points(self, index: int) -> list:
+        return self.datasets[index] if index < len(self.datasets) else []
+
+    def total(self, index: int) -> float:
+        """Soma do primeiro campo de todos os pontos (ex.: passos)."""
+        return sum(point.first or 0 for point in self.points(index))
+
+    def first_value(self, index: int) -> Optional[float]:
+        """Primeiro campo do primeiro ponto (ex.: média de batimentos), ou None."""
+        points = self.points(index)
+        return points[0].first if points else None
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Bucket":
+        start_ms, end_ms = int(data["startTimeMillis"]), int(data["endTimeMillis"])
+        datasets = []
+        for dataset in data.get("dataset", []):
+            points = []
+            for point in dataset.get("point", []):
+                values = tuple(
+                    value["intVal"] if "intVal" in value else value.get("fpVal")
+                    for value in point.get("value", [])
+                )
+                points.append(DataPoint(
+                    # Pontos agregados vêm em nanos; sem eles, valem os limites do bucket
+                    start_ms=int(point["startTimeNanos"]) // 1_000_000 if "startTimeNanos" in point else start_ms,
+                    end_ms=int(point["endTimeNanos"]) // 1_000_000 if "endTimeNanos" in point else end_ms,
+                    values=tuple(v for v in values if v is not None),
+                ))
+            datasets.append(points)
+        return cls(start_ms, end_ms, datasets)
+
+@dataclass(frozen=True)
+class SleepSession:
+    start_ms: int
+    end_ms: int
+
+    @property
+    def minutes(self) -> float:
+        return (self.end_ms - self.start_ms) / 60000
+
+    @property
+    def day(self) -> date:
+        """Dia (local) a que o sono pertence: o da manhã em que a sessão terminou."""
+        return datetime.fromtimestamp(self.end_ms / 1000).date()
+
+    @classmethod
+    def from_json(cls, data: dict) -> "SleepSession":
+        return cls(int(data["startTimeMillis"]), int(data["endTimeMillis"]))
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Date
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Date, Time, UniqueConstraint, Index, Text
 from sqlalchemy.orm import relationship
 from src.database.connection import Base
+from src.config.settings import settings
 import datetime
 
 class User(Base):
@@ -9,7 +10,14 @@ class User(Base):
     google_id = Column(String(255), unique=True, index=True)
     email = Column(String(255), unique=True)
     telegram_chat_id = Column(String(100), nullable=True)
+    # Horário local de entrega do relatório e fuso do usuário (IANA, ex.: America/Sao_Paulo)
+    report_time = Column(Time, nullable=False, default=datetime.time(21, 0))
+    timezone = Column(String(64), nullable=False, default=lambda: settings.DEFAULT_TIMEZONE)
+    # Última entrega confirmada do relatório agendado (UTC): evita reenvio ao reprocessar slots
+    last_report_at = Column(DateTime, nullable=True)
     
+    __table_args__ = (Index("ix_users_timezone_report_time", "timezone", "report_time"),)
+
     tokens = relationship("OAuthToken", back_populates="user", uselist=False)
     metrics = relationship("HealthMetric", back_populates="user")
 
@@ -25,11 +33,115 @@ class OAuthToken(Base):
 
 class HealthMetric(Base):
     __tablename__ = "health_metrics"
+    __table_args__ = (UniqueConstraint("user_id", "date", name="uq_health_metrics_user_date"),)
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     date = Column(Date, nullable=False)
-    steps = Column(Integer, default=0)
+    # Sem default: um relatório parcial grava só o que chegou e deixa os passos nulos
+    steps = Column(Integer, nullable=True)
     sleep_hours = Column(Float, default=0.0)
     heart_rate_avg = Column(Float, nullable=True)
 
-    user = relationship("User", back_populates="metrics")
\ No newline at end of file
+    user = relationship("User", back_populates="metrics")
+class SyncWatermark(Base):
+    __tablename__ = "sync_watermarks"
+    __table_args__ = (UniqueConstraint("user_id", "data_type", name="uq_sync_watermark_user_type"),)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    data_type = Column(String(100), nullable=False)
+    synced_until = Column(DateTime, nullable=False)
+
+class HealthDataPoint(Base):
+    __tablename__ = "health_data_points"
+    __table_args__ = (
+        UniqueConstraint("user_id", "data_type", "start_time", name="uq_data_point_user_type_start"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    data_type = Column(String(100), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    value = Column(Float, nullable=False)
+
+class DeadLetterMessage(Base):
+    __tablename__ = "dead_letter_messages"
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(String(100), nullable=False, index=True)
+    text = Column(Text, nullable=False)
+    error = Column(String(500), nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class SchedulerInstance(Base):
+    __tablename__ = "scheduler_instances"
+    instance_id = Column(String(255), primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False)
+
+class ShardLease(Base):
+    __tablename__ = "shard_leases"
+    shard_id = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String(255), nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+
+class BackfillCheckpoint(Base):
+    __tablename__ = "backfill_checkpoints"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, autoincrement=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    # Último dia gravado de forma contígua desde start_date; None = nada gravado ainda
+    completed_through = Column(Date, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class MetricRollup(Base):
+    """Agregados semanais (segunda a domingo) e mensais de health_metrics por usuário.
+
+    Mantidos a cada upsert diário; médias saem de total / dias com registro.
+    """
+    __tablename__ = "metric_rollups"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, autoincrement=False)
+    period = Column(String(8), primary_key=True)  # "week" ou "month"
+    period_start = Column(Date, primary_key=True)
+    days = Column(Integer, nullable=False, default=0)  # dias com passos registrados
+    steps_total = Column(BigInteger, nullable=False, default=0)
+    steps_min = Column(Integer, nullable=True)
+    steps_max = Column(Integer, nullable=True)
+    sleep_days = Column(Integer, nullable=False, default=0)
+    sleep_total = Column(Float, nullable=False, default=0.0)
+    sleep_min = Column(Float, nullable=True)
+    sleep_max = Column(Float, nullable=True)
+    heart_rate_days = Column(Integer, nullable=False, default=0)
+    heart_rate_total = Column(Float, nullable=False, default=0.0)
+    heart_rate_min = Column(Float, nullable=True)
+    heart_rate_max = Column(Float, nullable=True)
+    # Dias com a meta de passos batida e a maior sequência de dias seguidos no período
+    goal_days = Column(Integer, nullable=False, default=0)
+    best_streak = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    @property
+    def steps_avg(self):
+        return self.steps_total / self.days if self.days else None
+
+    @property
+    def sleep_avg(self):
+        return self.sleep_total / self.sleep_days if self.sleep_days else None
+
+    @property
+    def heart_rate_avg(self):
+        return self.heart_rate_total / self.heart_rate_days if self.heart_rate_days else None
+
+class SchedulerState(Base):
+    """Estado durável do processo entre reinícios (offset do getUpdates, watermark de entrega por shard)."""
+    __tablename__ = "scheduler_state"
+    key = Column(String(100), primary_key=True)
+    value = Column(String(255), nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class FitDataSource(Base):
+    """Fonte do Google Fit escolhida por usuário e tipo de dado (descoberta via dataSources.list)."""
+    __tablename__ = "fit_data_sources"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, autoincrement=False)
+    data_type = Column(String(100), primary_key=True)
+    # None = o usuário não tem fonte preferida para o tipo: agrega pelo dataTypeName
+    data_source_id = Column(String(255), nullable=True)
+    discovered_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
@@ -0,0 +1,183 @@
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from sqlalchemy import select
+from src.database.connection import AsyncReadSessionLocal
+from src.models.health_metric import HealthMetric, HealthDataPoint
+
+# Linhas por bloco do cursor no servidor: a memória do export não cresce com o histórico
+CHUNK_ROWS = 10000
+DAILY_FIELDS = ("steps", "sleep_hours", "heart_rate_avg")
+WEEKDAYS = ("seg", "ter", "qua", "qui", "sex", "sáb", "dom")
+
+@dataclass
+class DailyHistory:
+    """Histórico diário de um usuário em colunas NumPy, um elemento por dia do calendário.
+
+    Dias sem linha no banco (ou sem a métrica) ficam como NaN; as estatísticas os ignoram.
+    """
+    dates: np.ndarray  # datetime64[D], contínuo do primeiro ao último dia
+    steps: np.ndarray
+    sleep_hours: np.ndarray
+    heart_rate_avg: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @classmethod
+    def empty(cls) -> "DailyHistory":
+        return cls(np.array([], dtype="datetime64[D]"), *(np.array([], dtype=float) for _ in DAILY_FIELDS))
+
+def daily_history_query(user_id: int, start: datetime.date = None, end: datetime.date = None):
+    query = select(
+        HealthMetric.date, HealthMetric.steps, HealthMetric.sleep_hours, HealthMetric.heart_rate_avg,
+    ).where(HealthMetric.user_id == user_id)
+    if start:
+        query = query.where(HealthMetric.date >= start)
+    if end:
+        query = query.where(HealthMetric.date <= end)
+    return query.order_by(HealthMetric.date)
+
+def data_points_query(user_id: int, start: datetime.date = None, end: datetime.date = None):
+    query = select(
+        HealthDataPoint.data_type, HealthDataPoint.start_time, HealthDataPoint.end_time, HealthDataPoint.value,
+    ).where(HealthDataPoint.user_id == user_id)
+    if start:
+        query = query.where(HealthDataPoint.start_time >= datetime.datetime.combine(start, datetime.time.min))
+    if end:
+        query = query.where(HealthDataPoint.start_time < datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min))
+    return query.order_by(HealthDataPoint.data_type, HealthDataPoint.start_time)
+
+async def stream_chunks(query, chunk_rows: int = CHUNK_ROWS, session_factory=AsyncReadSessionLocal):
+    """Executa `query` com cursor no servidor e entrega as linhas em blocos de até `chunk_rows`.
+
+    Por padrão lê da réplica de leitura, quando configurada.
+    """
+    async with session_factory() as db:
+        result = await db.stream(query.execution_options(yield_per=chunk_rows))
+        async for chunk in result.partitions():
+            yield chunk
+
+async def load_daily_history(
+    user_id: int, start: datetime.date = None, end: datetime.date = None,
+    chunk_rows: int = CHUNK_ROWS, session_factory=AsyncReadSessionLocal,
+) -> DailyHistory:
+    """Lê o histórico diário direto para arrays (sem objetos do ORM) e o espalha no calendário."""
+    dates, columns = [], {name: [] for name in DAILY_FIELDS}
+    async for chunk in stream_chunks(daily_history_query(user_id, start, end), chunk_rows, session_factory):
+        chunk_dates, *values = zip(*chunk)
+        dates.append(np.array(chunk_dates, dtype="datetime64[D]"))
+        # dtype=float converte os NULLs do banco em NaN
+        for name, column in zip(DAILY_FIELDS, values):
+            columns[name].append(np.array(column, dtype=float))
+    if not dates:
+        return DailyHistory.empty()
+
+    dates = np.concatenate(dates)
+    first = np.datetime64(start, "D") if start else dates[0]
+    last = np.datetime64(end, "D") if end else dates[-1]
+    calendar = np.arange(first, last + 1, dtype="datetime64[D]")
+    index = (dates - first).astype(np.int64)
+    dense = {}
+    for name in DAILY_FIELDS:
+        column = np.full(len(calendar), np.nan)
+        column[index] = np.concatenate(columns[name])
+        dense[name] = column
+    # Sono 0 = não registrado (mesma regra dos agregados)
+    dense["sleep_hours"][dense["sleep_hours"] == 0] = np.nan
+    return DailyHistory(calendar, **dense)
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """Média móvel de `window` dias ignorando NaN; NaN onde a janela não tem nenhum valor."""
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    lows = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    window_sums = sums[1:] - sums[lows]
+    window_counts = counts[1:] - counts[lows]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(window_counts > 0, window_sums / window_counts, np.nan)
+
+def percentiles(values: np.ndarray, qs=(10, 50, 90)) -> dict:
+    """Percentis dos dias com registro; None quando não há nenhum."""
+    present = values[~np.isnan(values)]
+    if not present.size:
+        return {q: None for q in qs}
+    return dict(zip(qs, np.percentile(present, qs).tolist()))
+
+def weekday_profile(dates: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Média por dia da semana (segunda a domingo); NaN para dias da semana sem registro."""
+    valid = ~np.isnan(values)
+    # 1970-01-01 foi uma quinta-feira (3, contando segunda = 0)
+    weekdays = (dates.astype("datetime64[D]").astype(np.int64) + 3) % 7
+    sums = np.bincount(weekdays[valid], weights=values[valid], minlength=7)
+    counts = np.bincount(weekdays[valid], minlength=7)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def _number(value) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), 2)
+
+def summarize(history: DailyHistory, window: int = 7) -> dict:
+    """Estatísticas por métrica: média, percentis, última média móvel e perfil semanal."""
+    summary = {"days": len(history)}
+    if not len(history):
+        return summary
+    summary["start"], summary["end"] = str(history.dates[0]), str(history.dates[-1])
+    for name in DAILY_FIELDS:
+        values = getattr(history, name)
+        present = int((~np.isnan(values)).sum())
+        summary[name] = {
+            "days_with_data": present,
+            "mean": _number(np.nanmean(values)) if present else None,
+            "percentiles": {f"p{q}": _number(v) for q, v in percentiles(values).items()},
+            f"moving_average_{window}d": _number(moving_average(values, window)[-1]),
+            "weekday": dict(zip(WEEKDAYS, (_number(v) for v in weekday_profile(history.dates, values)))),
+        }
+    return summary
+
+def save_npz(history: DailyHistory, path: str):
+    """Grava as colunas do histórico em um .npz (np.load devolve os mesmos arrays)."""
+    np.savez_compressed(path, dates=history.dates, **{name: getattr(history, name) for name in DAILY_FIELDS})
+
+def _arrow_schema(dataset: str):
+    import pyarrow as pa
+
+    if dataset == "daily":
+        return pa.schema([
+            ("date", pa.date32()), ("steps", pa.int64()),
+            ("sleep_hours", pa.float64()), ("heart_rate_avg", pa.float64()),
+        ])
+    return pa.schema([
+        ("data_type", pa.string()), ("start_time", pa.timestamp("ms")),
+        ("end_time", pa.timestamp("ms")), ("value", pa.float64()),
+    ])
+
+async def export_parquet(
+    user_id: int, path: str, dataset: str = "daily", start: datetime.date = None, end: datetime.date = None,
+    chunk_rows: int = CHUNK_ROWS, session_factory=AsyncReadSessionLocal,
+) -> int:
+    """Grava o histórico ("daily" ou "points") em Parquet, um row group por bloco do cursor.
+
+    Só um bloco fica em memória por vez, seja um mês ou anos de pontos de 15 minutos.
+    Devolve o número de linhas gravadas.
+    """
+    # O pyarrow só é necessário para o export: o bot e as estatísticas não o carregam
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if dataset not in ("daily", "points"):
+        raise ValueError(f"dataset desconhecido: {dataset!r} (use 'daily' ou 'points')")
+    query = daily_history_query(user_id, start, end) if dataset == "daily" else data_points_query(user_id, start, end)
+    schema = _arrow_schema(dataset)
+
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        async for chunk in stream_chunks(query, chunk_rows, session_factory):
+            columns = zip(*chunk)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema,
+            ))
+            rows += len(chunk)
+    return rows
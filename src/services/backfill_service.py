@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import random
+import time as clock
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+import httpx
+from src.config.settings import settings
+from src.clients.google_fit_client import GoogleFitClient, GoogleFitError
+from src.clients.http_client import get_http_client
+from src.database.connection import db_session
+from src.database.upserts import upsert_health_metrics
+from src.models.google_fit import AggregateRequest, STEPS, HEART_RATE
+from src.models.health_metric import BackfillCheckpoint
+from src.services.data_source_service import DataSourceResolver, data_source_resolver
+from src.services.metrics import FAILURES, RETRIES
+from src.services.rate_limit import TokenBucket
+from src.services.report_cache import report_cache
+from src.services.token_manager import TokenManager, token_manager
+
+logger = logging.getLogger("mensageiro-fit")
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+@dataclass
+class Chunk:
+    user_id: int
+    start: date
+    end: date  # inclusivo
+
+def split_range(user_id: int, start: date, end: date, chunk_days: int):
+    """Divide [start, end] em janelas de até chunk_days dias."""
+    chunks = []
+    current = start
+    while current <= end:
+        chunk_end = min(current + timedelta(days=chunk_days - 1), end)
+        chunks.append(Chunk(user_id, current, chunk_end))
+        current = chunk_end + timedelta(days=1)
+    return chunks
+
+class BackfillService:
+    """Carrega o histórico do Google Fit em janelas de dias, em paralelo e com retomada.
+
+    Cada janela faz um dataset:aggregate (passos + batimentos, bucket de 1 dia) e uma
+    listagem de sessões de sono; os dias viram upserts em health_metrics e o checkpoint
+    do usuário avança até o último dia gravado de forma contígua.
+    """
+
+    def __init__(self, client: httpx.AsyncClient = None, tokens: TokenManager = None, sources: DataSourceResolver = None):
+        self.client = client or get_http_client()
+        self.tokens = tokens or token_manager
+        self.sources = sources or data_source_resolver
+        self._semaphore = asyncio.Semaphore(settings.BACKFILL_CONCURRENCY)
+        self._pacer = TokenBucket(settings.BACKFILL_REQUESTS_PER_SECOND)
+        self.counters = {"requests": 0, "quota_waits": 0, "days_written": 0, "chunks_failed": 0}
+
+    async def backfill_users(self, user_ids, start: date, end: date):
+        """Roda o backfill de vários usuários; retorna {user_id: último dia concluído}."""
+        started = clock.perf_counter()
+        await self.tokens.warm(user_ids)
+        await self.sources.warm(user_ids)
+        results = await asyncio.gather(
+            *(self.backfill_user(user_id, start, end) for user_id in user_ids), return_exceptions=True
+        )
+        try:
+            await self.sources.flush()
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar fontes do Google Fit: {e!r}")
+        summary = {}
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Backfill do usuário {user_id} falhou: {result!r}")
+                result = None
+            summary[user_id] = result
+        logger.info(
+            f"📚 Backfill: {len(user_ids)} usuários, {self.counters['days_written']} dias gravados, "
+            f"{self.counters['requests']} requisições em {clock.perf_counter() - started:.1f}s"
+        )
+        return summary
+
+    async def backfill_user(self, user_id: int, start: date, end: date) -> Optional[date]:
+        """Backfill de um usuário, retomando do checkpoint quando o intervalo é o mesmo."""
+        checkpoint = await self._load_checkpoint(user_id, start, end)
+        resume_from = checkpoint.completed_through + timedelta(days=1) if checkpoint.completed_through else start
+        if resume_from > end:
+            logger.info(f"✅ Backfill do usuário {user_id} já concluído até {end}")
+            return end
+
+        chunks = split_range(user_id, resume_from, end, settings.BACKFILL_CHUNK_DAYS)
+        done = [False] * len(chunks)
+        next_pending = 0
+        lock = asyncio.Lock()
+
+        async def run(index: int, chunk: Chunk):
+            nonlocal next_pending
+            await self._run_chunk(chunk)
+            async with lock:
+                done[index] = True
+                # O checkpoint só avança sobre janelas contíguas concluídas
+                advanced = None
+                while next_pending < len(chunks) and done[next_pending]:
+                    advanced = chunks[next_pending].end
+                    next_pending += 1
+                if advanced:
+                    await self._save_checkpoint(user_id, advanced)
+
+        results = await asyncio.gather(*(run(i, c) for i, c in enumerate(chunks)), return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            self.counters["chunks_failed"] += len(failures)
+            FAILURES.labels("backfill", "chunk").inc(len(failures))
+            logger.warning(f"⚠️ Backfill do usuário {user_id}: {len(failures)} janelas falharam (retomável): {failures[0]!r}")
+        report_cache.invalidate_user(user_id)
+        return chunks[next_pending - 1].end if next_pending else checkpoint.completed_through
+
+    async def _run_chunk(self, chunk: Chunk):
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                rows = await self._fetch_chunk(chunk)
+                break
+            except (GoogleFitError, httpx.TransportError) as e:
+                # 4xx definitivo (ex.: permissão revogada) não melhora com retentativa
+                if isinstance(e, GoogleFitError) and not e.retryable or attempts >= settings.BACKFILL_MAX_ATTEMPTS:
+                    raise
+                delay = getattr(e, "retry_after", None) or 2 ** attempts + random.uniform(0, 1)
+                if getattr(e, "status_code", None) == 429:
+                    self.counters["quota_waits"] += 1
+                RETRIES.labels("backfill").inc()
+                logger.warning(f"⚠️ Backfill {chunk.user_id} {chunk.start}..{chunk.end}: nova tentativa em {delay:.1f}s ({e})")
+                await asyncio.sleep(delay)
+
+        async with db_session() as db:
+            await upsert_health_metrics(db, rows)
+            await db.commit()
+        self.counters["days_written"] += len(rows)
+
+    async def _paced(self, call):
+        # Ritmo global de requisições + limite de concorrência: cabe na quota do projeto
+        await self._pacer.acquire()
+        async with self._semaphore:
+            self.counters["requests"] += 1
+            return await call
+
+    async def _fetch_chunk(self, chunk: Chunk):
+        token = await self.tokens.get_token(chunk.user_id)
+        if not token:
+            raise RuntimeError(f"sem token válido para o usuário {chunk.user_id}")
+        # As retentativas ficam no laço de _run_chunk, que respeita o ritmo da quota
+        fit = GoogleFitClient(token, self.client, max_attempts=1)
+
+        # Buckets de 1 dia alinhados à meia-noite local do início da janela
+        start_dt = datetime.combine(chunk.start, time.min)
+        end_dt = datetime.combine(chunk.end + timedelta(days=1), time.min)
+        start_ms, end_ms = int(start_dt.timestamp() * 1000), int(end_dt.timestamp() * 1000)
+        # Descoberta uma vez por usuário (as janelas simultâneas esperam a mesma chamada)
+        sources = await self.sources.sources_for(chunk.user_id, fit)
+
+        buckets, sessions = await asyncio.gather(
+            self._paced(fit.aggregate(AggregateRequest(
+                sources=(sources[STEPS], sources[HEART_RATE]),
+                start_ms=start_ms, end_ms=end_ms, bucket_ms=DAY_MS,
+            ))),
+            self._paced(fit.get_sleep_sessions(start_ms, end_ms)),
+        )
+
+        days = {}
+        for bucket in buckets:
+            day = datetime.fromtimestamp(bucket.start_ms / 1000).date()
+            days[day] = {"user_id": chunk.user_id, "date": day, "steps": int(bucket.total(0))}
+            heart = bucket.first_value(1)
+            if heart is not None:
+                days[day]["heart_rate_avg"] = heart
+
+        # O sono conta para o dia em que a sessão terminou; dia sem sessão não grava 0
+        sleep_minutes = {}
+        for session in sessions:
+            if session.day in days:
+                sleep_minutes[session.day] = sleep_minutes.get(session.day, 0) + session.minutes
+        for day, minutes in sleep_minutes.items():
+            days[day]["sleep_hours"] = round(minutes / 60, 2)
+        return list(days.values())
+
+    async def _load_checkpoint(self, user_id: int, start: date, end: date) -> BackfillCheckpoint:
+        async with db_session() as db:
+            checkpoint = await db.get(BackfillCheckpoint, user_id)
+            if checkpoint and (checkpoint.start_date, checkpoint.end_date) != (start, end):
+                # Intervalo diferente: recomeça (os upserts tornam o recarregamento seguro)
+                checkpoint.start_date, checkpoint.end_date, checkpoint.completed_through = start, end, None
+            elif not checkpoint:
+                checkpoint = BackfillCheckpoint(user_id=user_id, start_date=start, end_date=end)
+                db.add(checkpoint)
+            await db.commit()
+            return checkpoint
+
+    async def _save_checkpoint(self, user_id: int, completed_through: date):
+        async with db_session() as db:
+            checkpoint = await db.get(BackfillCheckpoint, user_id)
+            checkpoint.completed_through = completed_through
+            await db.commit()
@@ -0,0 +1,53 @@
+import io
+import numpy as np
+
+# Roda nos processos do pool de gráficos: só recebe arrays e devolve bytes (tudo picklável).
+
+def warm_up():
+    """Initializer dos workers: carrega o matplotlib antes do primeiro pedido."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+    import src.services.analytics  # noqa: F401
+
+def render_trend_chart(
+    dates: np.ndarray, steps: np.ndarray, sleep_hours: np.ndarray, heart_rate_avg: np.ndarray,
+    title: str, window: int = 7,
+) -> bytes:
+    """PNG com três painéis (passos, sono e batimentos) e a média móvel de `window` dias."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.dates as mdates
+    import matplotlib.pyplot as plt
+    from src.services.analytics import moving_average
+
+    x = dates.astype("datetime64[D]").astype("O")
+    panels = (
+        ("Passos", steps, "#4c8bf5", "bar"),
+        ("Sono (h)", sleep_hours, "#8e6cef", "line"),
+        ("Batimentos (BPM)", heart_rate_avg, "#e5534b", "line"),
+    )
+    fig, axes = plt.subplots(len(panels), 1, figsize=(8, 7), sharex=True, dpi=100)
+    try:
+        for ax, (label, values, color, kind) in zip(axes, panels):
+            if kind == "bar":
+                ax.bar(x, np.nan_to_num(values), color=color, alpha=0.45, width=0.8)
+            else:
+                ax.plot(x, values, color=color, alpha=0.45, marker="o", markersize=2, linewidth=1)
+            if len(values) >= window:
+                ax.plot(x, moving_average(values, window), color=color, linewidth=2, label=f"média {window}d")
+                ax.legend(loc="upper left", fontsize=8, frameon=False)
+            ax.set_ylabel(label, fontsize=9)
+            ax.grid(axis="y", alpha=0.3)
+            ax.spines[["top", "right"]].set_visible(False)
+        axes[-1].xaxis.set_major_formatter(mdates.DateFormatter("%d/%m"))
+        fig.suptitle(title, fontsize=12)
+        fig.tight_layout()
+
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+from sqlalchemy import func, select
+from src.config.settings import settings
+from src.database.connection import AsyncReadSessionLocal
+from src.models.health_metric import HealthMetric
+from src.services.metrics import CHART_RENDER_SECONDS
+from src.services.telegram_queue import TelegramDeliveryQueue, telegram_queue
+
+logger = logging.getLogger("mensageiro-fit")
+
+@dataclass
+class RenderedChart:
+    png: bytes
+    file_id: Optional[str] = None  # preenchido após o primeiro envio
+
+class ChartService:
+    """Gera gráficos PNG de tendência num pool de processos e os envia pelo sendPhoto.
+
+    - A renderização (matplotlib) roda fora do event loop, em CHART_WORKERS processos.
+    - Cada imagem fica em cache por (usuário, intervalo, versão dos dados); a versão é
+      uma impressão digital das linhas do intervalo, então qualquer gravação gera outra.
+    - Depois do primeiro upload a imagem é reenviada pelo file_id do Telegram.
+    """
+
+    def __init__(self, queue: TelegramDeliveryQueue = None, session_factory=AsyncReadSessionLocal, max_entries: int = None):
+        self._queue = queue or telegram_queue
+        self._session_factory = session_factory
+        self.max_entries = max_entries or settings.CHART_CACHE_MAX_ENTRIES
+        self._entries: OrderedDict = OrderedDict()
+        self._rendering: dict[tuple, asyncio.Task] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.counters = {"renders": 0, "hits": 0, "uploads": 0, "file_id_sends": 0}
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            from src.services.chart_renderer import warm_up
+
+            # spawn: os workers não herdam as threads e conexões abertas do bot
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.CHART_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up,
+            )
+        return self._pool
+
+    def shutdown(self):
+        """Encerra o pool de renderização (chamado no encerramento do bot)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def data_version(self, user_id: int, start: date, end: date) -> tuple:
+        """Impressão digital das linhas diárias do intervalo (uma consulta agregada no índice)."""
+        async with self._session_factory() as db:
+            result = await db.execute(select(
+                func.count(), func.max(HealthMetric.date), func.sum(HealthMetric.steps),
+                func.sum(HealthMetric.sleep_hours), func.sum(HealthMetric.heart_rate_avg),
+            ).where(HealthMetric.user_id == user_id, HealthMetric.date >= start, HealthMetric.date <= end))
+            return tuple(result.one())
+
+    async def get_chart(self, user_id: int, days: int, end: date = None) -> Optional[RenderedChart]:
+        """Imagem dos últimos `days` dias (do cache quando os dados não mudaram); None se não houver dados."""
+        end = end or date.today()
+        start = end - timedelta(days=days - 1)
+        version = await self.data_version(user_id, start, end)
+        if not version[0]:
+            return None
+        key = (user_id, start, end, version)
+
+        chart = self._entries.get(key)
+        if chart is not None:
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return chart
+
+        # Pedidos simultâneos do mesmo gráfico compartilham uma renderização
+        task = self._rendering.get(key)
+        if task is None:
+            task = asyncio.create_task(self._render(user_id, start, end, days))
+            self._rendering[key] = task
+            task.add_done_callback(lambda _: self._rendering.pop(key, None))
+        chart = RenderedChart(await task)
+        self._store(key, chart)
+        # Quem esperou a mesma renderização fica com o mesmo objeto (e o mesmo file_id)
+        return self._entries.get(key, chart)
+
+    async def _render(self, user_id: int, start: date, end: date, days: int) -> bytes:
+        from src.services.analytics import load_daily_history
+        from src.services.chart_renderer import render_trend_chart
+
+        history = await load_daily_history(user_id, start, end, session_factory=self._session_factory)
+        title = f"Últimos {days} dias ({start:%d/%m} a {end:%d/%m})"
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.pool, render_trend_chart,
+                history.dates, history.steps, history.sleep_hours, history.heart_rate_avg, title,
+            )
+        finally:
+            self.counters["renders"] += 1
+            CHART_RENDER_SECONDS.observe(time.perf_counter() - started)
+
+    def _store(self, key, chart: RenderedChart):
+        if key in self._entries:
+            return
+        self._entries[key] = chart
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def send_chart(self, chat_id, user_id: int, days: int, caption: str = "") -> bool:
+        """Envia o gráfico dos últimos `days` dias; False se não houver dados ou o envio falhar."""
+        chart = await self.get_chart(user_id, days)
+        if chart is None:
+            return False
+
+        if chart.file_id:
+            self.counters["file_id_sends"] += 1
+            if await self._queue.send_photo(chat_id, chart.file_id, caption):
+                return True
+            # file_id recusado (arquivo expirado no Telegram): sobe os bytes de novo
+            chart.file_id = None
+
+        self.counters["uploads"] += 1
+        file_id = await self._queue.send_photo(chat_id, chart.png, caption)
+        if file_id:
+            chart.file_id = file_id
+        return file_id is not None
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), **self.counters}
+
+chart_service = ChartService()
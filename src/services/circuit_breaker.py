@@ -0,0 +1,66 @@
+import logging
+import time
+from src.config.settings import settings
+from src.services.metrics import CIRCUIT_OPEN
+
+logger = logging.getLogger("mensageiro-fit")
+
+class CircuitBreaker:
+    """Disjuntor por endpoint: após `failure_threshold` falhas seguidas, falha rápido por `reset_timeout`.
+
+    Passado o intervalo, libera uma única chamada de teste (meio-aberto): sucesso fecha
+    o circuito, falha reabre.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.FIT_BREAKER_FAILURES
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.FIT_BREAKER_RESET_SECONDS
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def retry_after(self) -> float:
+        """Segundos até o circuito aceitar a próxima chamada de teste."""
+        if self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.retry_after > 0 or self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def release_probe(self):
+        """Devolve a chamada de teste sem resultado (ex.: cancelada), para a próxima poder testar."""
+        self._probing = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"✅ Circuito {self.name} fechado: Google Fit respondeu de novo")
+            CIRCUIT_OPEN.labels(self.name).set(0)
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+            if self.opened_at is None:
+                logger.warning(f"⚠️ Circuito {self.name} aberto após {self.failures} falhas seguidas")
+            self.opened_at = time.monotonic()
+            self._probing = False
+            CIRCUIT_OPEN.labels(self.name).set(1)
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+def breaker_for(name: str) -> CircuitBreaker:
+    """Disjuntor compartilhado pelo processo para o endpoint `name`."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
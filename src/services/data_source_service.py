@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, select
+from src.clients.google_fit_client import GoogleFitClient
+from src.config.settings import settings
+from src.database.connection import AsyncSessionLocal
+from src.database.upserts import upsert_statement
+from src.models.google_fit import AggregateSource, HEART_RATE, STEPS, best_source
+from src.models.health_metric import FitDataSource
+from src.services.metrics import FAILURES
+
+logger = logging.getLogger("mensageiro-fit")
+
+# Tipos agregados por fonte; o sono vem das Sessões e não passa por aqui
+DATA_TYPES = (STEPS, HEART_RATE)
+
+class DataSourceResolver:
+    """Fonte do Google Fit a usar por usuário e tipo de dado, em cache na memória e em fit_data_sources.
+
+    - Sem escolha gravada: descobre via dataSources.list (uma chamada por usuário, mesmo
+      com pedidos simultâneos) e guarda na memória; flush() grava no banco em lote.
+    - Escolha mais velha que FIT_SOURCE_TTL_HOURS: continua valendo e é renovada em segundo plano.
+    - Descoberta falhou ou o usuário não tem fonte preferida: agrega pelo tipo, como antes
+      (a falha fica em memória e é tentada de novo após FIT_SOURCE_RETRY_MINUTES).
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+        # user_id -> (discovered_at, {tipo: data_source_id | None}); None = nada gravado no banco
+        self._cache: dict[int, Optional[tuple]] = {}
+        self._discovering: dict[int, asyncio.Task] = {}
+        self._dirty: set[int] = set()
+        self.counters = {"hits": 0, "db_loads": 0, "discoveries": 0, "background_refreshes": 0, "failures": 0}
+
+    async def sources_for(self, user_id: int, fit: GoogleFitClient) -> dict:
+        """{tipo: AggregateSource} para o usuário; `fit` é usado se for preciso descobrir agora."""
+        choice = await self._choice(user_id, fit)
+        return {data_type: AggregateSource.for_type(data_type, choice.get(data_type)) for data_type in DATA_TYPES}
+
+    async def warm(self, user_ids):
+        """Pré-carrega do banco, em uma única consulta, as escolhas que ainda não estão em memória."""
+        missing = [user_id for user_id in user_ids if user_id not in self._cache]
+        if missing:
+            await self._load(missing)
+
+    async def _choice(self, user_id: int, fit: GoogleFitClient) -> dict:
+        if user_id in self._cache:
+            self.counters["hits"] += 1
+            entry = self._cache[user_id]
+        else:
+            entry = (await self._load([user_id])).get(user_id)
+
+        if entry is None:
+            # Primeira vez: espera a descoberta (dentro do prazo do cliente de quem pediu)
+            # shield: um relatório cancelado não derruba a descoberta compartilhada
+            return await asyncio.shield(self._discover_single_flight(user_id, fit)) or {}
+
+        discovered_at, choice = entry
+        if discovered_at < datetime.utcnow() - timedelta(hours=settings.FIT_SOURCE_TTL_HOURS):
+            # A renovação não herda o prazo do relatório que a disparou
+            if user_id not in self._discovering:
+                self.counters["background_refreshes"] += 1
+            self._discover_single_flight(user_id, GoogleFitClient(fit.access_token, fit.client))
+        return choice
+
+    def _discover_single_flight(self, user_id: int, fit: GoogleFitClient) -> asyncio.Task:
+        task = self._discovering.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._discover(user_id, fit))
+            self._discovering[user_id] = task
+            task.add_done_callback(lambda _: self._discovering.pop(user_id, None))
+        return task
+
+    async def _discover(self, user_id: int, fit: GoogleFitClient) -> Optional[dict]:
+        self.counters["discoveries"] += 1
+        try:
+            sources = await fit.list_data_sources(DATA_TYPES)
+        except Exception as e:
+            self.counters["failures"] += 1
+            FAILURES.labels("data_sources", type(e).__name__).inc()
+            logger.warning(f"⚠️ Descoberta de fontes do usuário {user_id} falhou; agregando por tipo ({e!r})")
+            # A falha também fica na memória (agregar pelo tipo), já quase vencida: os próximos
+            # relatórios não repetem a chamada dentro do orçamento deles, e a nova tentativa sai
+            # em segundo plano depois de FIT_SOURCE_RETRY_MINUTES
+            retry_in = timedelta(hours=settings.FIT_SOURCE_TTL_HOURS) - timedelta(minutes=settings.FIT_SOURCE_RETRY_MINUTES)
+            self._cache[user_id] = (datetime.utcnow() - retry_in, {data_type: None for data_type in DATA_TYPES})
+            return None
+
+        choice = {data_type: best_source(data_type, sources) for data_type in DATA_TYPES}
+        # Só memória aqui: quem pediu pode estar segurando uma conexão do pool
+        self._cache[user_id] = (datetime.utcnow(), choice)
+        self._dirty.add(user_id)
+        logger.info(f"🔎 Fontes do usuário {user_id}: {choice}")
+        return choice
+
+    async def _load(self, user_ids) -> dict:
+        async with self._session_factory() as db:
+            rows = (await db.execute(select(FitDataSource).where(FitDataSource.user_id.in_(user_ids)))).scalars().all()
+        self.counters["db_loads"] += 1
+        by_user: dict[int, list] = {}
+        for row in rows:
+            by_user.setdefault(row.user_id, []).append(row)
+        loaded = {}
+        for user_id in user_ids:
+            user_rows = by_user.get(user_id)
+            if not user_rows:
+                loaded[user_id] = None
+                continue
+            # Um tipo novo em DATA_TYPES sem linha gravada conta como escolha vencida
+            complete = len(user_rows) == len(DATA_TYPES)
+            discovered_at = min(row.discovered_at for row in user_rows) if complete else datetime.min
+            loaded[user_id] = (discovered_at, {row.data_type: row.data_source_id for row in user_rows})
+        # Não sobrescreve o que uma descoberta concorrente já pôs na memória
+        for user_id, entry in loaded.items():
+            self._cache.setdefault(user_id, entry)
+        return {user_id: self._cache[user_id] for user_id in user_ids}
+
+    def invalidate(self, user_id: int):
+        """Esquece a escolha do usuário (ex.: a fonte sumiu); a próxima chamada redescobre."""
+        self._cache[user_id] = None
+        self._dirty.add(user_id)
+
+    async def flush(self) -> int:
+        """Grava no banco, em uma única transação, as escolhas descobertas ou esquecidas desde o último flush."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        rows = [
+            {"user_id": user_id, "data_type": data_type, "data_source_id": source, "discovered_at": entry[0]}
+            for user_id in dirty if (entry := self._cache.get(user_id))
+            for data_type, source in entry[1].items()
+        ]
+        try:
+            async with self._session_factory() as db:
+                await db.execute(delete(FitDataSource).where(FitDataSource.user_id.in_(dirty)))
+                if rows:
+                    await db.execute(upsert_statement(
+                        db.bind.dialect.name, FitDataSource.__table__, rows,
+                        ["user_id", "data_type"], ("data_source_id", "discovered_at"),
+                    ))
+                await db.commit()
+            return len(dirty)
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+    def clear(self):
+        """Esvazia o cache em memória (benchmarks e testes que recriam o banco)."""
+        self._cache.clear()
+        self._dirty.clear()
+
+    def stats(self) -> dict:
+        return {"users": len(self._cache), **self.counters}
+
+data_source_resolver = DataSourceResolver()
@@ -1,53 +1,214 @@
+import asyncio
 import datetime
-from sqlalchemy.orm import Session
-from src.clients.google_fit_client import GoogleFitClient
-from src.models.health_metric import OAuthToken, HealthMetric
+import logging
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.clients.google_fit_client import GoogleFitClient, GoogleFitError
+from src.config.settings import settings
+from src.database.connection import db_session
+from src.database.upserts import BATCH_SIZE, upsert_health_metrics, upsert_statement
+from src.models.daily_metrics import DailyMetrics
+from src.models.google_fit import AggregateRequest, AggregateSource, STEPS, HEART_RATE
+from src.models.health_metric import HealthDataPoint, SyncWatermark
+from src.services.data_source_service import DataSourceResolver, data_source_resolver
+
+logger = logging.getLogger("mensageiro-fit")
+
+# Tipos de dado sincronizados de forma incremental
+SLEEP = "sleep"
+# Passos e batimentos vêm num único dataset:aggregate, um dataset por tipo nesta ordem
+ACTIVITY_TYPES = (STEPS, HEART_RATE)
+
+def _to_ms(dt: datetime.datetime) -> int:
+    return int(dt.timestamp() * 1000)
+
+def _from_ms(ms: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(ms / 1000)
 
 class GoogleFitService:
-    def __init__(self, db: Session):
-        self.db = db
-
-    def sync_user_data(self, user_id: int):
-       #Coordena a coleta de dados para um usuário específico
-        token_data = self.db.query(OAuthToken).filter_by(user_id=user_id).first()
-        
-        if not token_data:
-            return None
-
-        client = GoogleFitClient(
-            access_token=token_data.access_token,
-            refresh_token=token_data.refresh_token,
-            expires_at=token_data.expires_at
-        )
+    """Sincronização incremental do Google Fit e totais diários calculados dos pontos locais.
+
+    É a única escrita de health_metrics a partir do Google Fit: o relatório e o /hoje
+    sincronizam o delta e usam os mesmos totais que ficam gravados. Nenhuma sessão do
+    banco fica aberta durante as chamadas ao Google.
+    """
+
+    def __init__(self, client: GoogleFitClient = None, sources: DataSourceResolver = None):
+        self.client = client
+        self.sources = sources or data_source_resolver
+
+    async def sync_user_data(self, user_id: int, access_token: str = None) -> DailyMetrics:
+        """Coleta incremental de um usuário: pontos novos desde o watermark e totais dos dias tocados.
 
-        # 1. Tenta atualizar token se necessário
-        new_creds = client.refresh_user_token()
-        if new_creds:
-            token_data.access_token = new_creds.token
-            token_data.expires_at = new_creds.expiry
-            self.db.commit()
+        Devolve as métricas de hoje; um tipo cuja chamada falhou volta em `missing` e
+        mantém o watermark, para ser buscado de novo na próxima rodada.
+        """
+        # 1. O token já chega válido (renovado pelo TokenManager)
+        client = self.client or GoogleFitClient(access_token)
 
-        # 2. Define intervalo (Hoje, da meia-noite até agora)
+        # 2. Busca só o que chegou desde a última sincronização de cada tipo
         now = datetime.datetime.now()
-        start_of_day = datetime.datetime.combine(now.date(), datetime.time.min)
-        
-        start_ms = int(start_of_day.timestamp() * 1000)
-        end_ms = int(now.timestamp() * 1000)
-
-        # 3. Busca métricas
-        steps = client.get_daily_steps(start_ms, end_ms)
-
-        # 4. Salva ou atualiza no banco
-        metric = self.db.query(HealthMetric).filter_by(
-            user_id=user_id, 
-            date=now.date()
-        ).first()
-
-        if not metric:
-            metric = HealthMetric(user_id=user_id, date=now.date())
-            self.db.add(metric)
-
-        metric.steps = steps
-        self.db.commit()
-        
-        return metric
\ No newline at end of file
+        async with db_session() as db:
+            watermarks = await self._load_watermarks(db, user_id)
+        bucket_ms = settings.SYNC_BUCKET_MINUTES * 60 * 1000
+
+        # Buckets alinhados até agora; o último, incompleto, é regravado na próxima rodada
+        # (o watermark só avança até o último bucket completo)
+        activity_start = min(self._window_start(watermarks.get(t), now) for t in ACTIVITY_TYPES)
+        activity_window = (_to_ms(activity_start) // bucket_ms * bucket_ms, _to_ms(now))
+        activity_synced_until = _from_ms(_to_ms(now) // bucket_ms * bucket_ms)
+
+        sleep_start = self._window_start(watermarks.get(SLEEP), now)
+        if SLEEP not in watermarks:
+            # Sono da noite anterior termina hoje, mas começa ontem
+            sleep_start -= datetime.timedelta(days=1)
+        sleep_window = (_to_ms(sleep_start), _to_ms(now))
+
+        # As chamadas ao Google saem em paralelo; uma falha não derruba a outra
+        activity, sessions = await asyncio.gather(
+            self._fetch_activity(client, user_id, *activity_window, bucket_ms),
+            client.get_sleep_sessions(*sleep_window),
+            return_exceptions=True,
+        )
+
+        metrics = DailyMetrics()
+        touched_days = {now.date()}
+        async with db_session() as db:
+            watermarks = await self._load_watermarks(db, user_id)
+            if isinstance(activity, BaseException):
+                logger.warning(f"⚠️ Passos/batimentos do usuário {user_id} indisponíveis: {activity!r}")
+                metrics.missing |= {"steps", "heart_rate"}
+            else:
+                for data_type, points in activity.items():
+                    await self._store_points(db, user_id, data_type, points)
+                    self._advance_watermark(db, watermarks.get(data_type), user_id, data_type, activity_synced_until)
+                    touched_days |= {_from_ms(p[0]).date() for p in points}
+
+            if isinstance(sessions, BaseException):
+                logger.warning(f"⚠️ Sono do usuário {user_id} indisponível: {sessions!r}")
+                metrics.missing.add("sleep")
+            else:
+                sleep_points = [(s.start_ms, s.end_ms, s.minutes) for s in sessions]
+                await self._store_points(db, user_id, SLEEP, sleep_points)
+                self._advance_watermark(db, watermarks.get(SLEEP), user_id, SLEEP, now)
+                touched_days |= {s.day for s in sessions}
+            # Os watermarks novos entram antes da leitura dos totais
+            await db.flush()
+
+            # 3. Recalcula os totais diários a partir dos pontos locais, num único upsert
+            totals = {day: await self.daily_totals(db, user_id, day) for day in sorted(touched_days)}
+            rows = [{"user_id": user_id, "date": day, **fields} for day, fields in totals.items() if fields]
+            await upsert_health_metrics(db, rows)
+            await db.commit()
+
+        today = totals[now.date()]
+        metrics.steps = today.get("steps", 0)
+        metrics.heart_rate_avg = today.get("heart_rate_avg")
+        metrics.sleep_hours = today.get("sleep_hours")
+        return metrics
+
+    async def _sources_for(self, user_id: int, client: GoogleFitClient) -> dict:
+        """Fontes do usuário; sem elas (ex.: banco fora) agrega pelo tipo."""
+        try:
+            return await self.sources.sources_for(user_id, client)
+        except Exception as e:
+            logger.warning(f"⚠️ Fontes do usuário {user_id} indisponíveis: {e!r}")
+            return {data_type: AggregateSource.for_type(data_type) for data_type in ACTIVITY_TYPES}
+
+    async def _fetch_activity(self, client: GoogleFitClient, user_id: int, start_ms: int, end_ms: int, bucket_ms: int) -> dict:
+        """Passos e batimentos da janela num único dataset:aggregate: {tipo: [(inicio_ms, fim_ms, valor)]}."""
+        sources = await self._sources_for(user_id, client)
+
+        def request(sources: dict) -> AggregateRequest:
+            return AggregateRequest(
+                sources=tuple(sources[t] for t in ACTIVITY_TYPES), start_ms=start_ms, end_ms=end_ms, bucket_ms=bucket_ms,
+            )
+
+        try:
+            buckets = await client.aggregate(request(sources))
+        except GoogleFitError as e:
+            # Só "fonte não encontrada" (400/404) cai para o tipo; 401/403 é problema do token,
+            # não da escolha gravada
+            if e.status_code not in (400, 404) or not any(source.data_source_id for source in sources.values()):
+                raise
+            # Fonte gravada sumiu (aparelho removido, permissão revogada): redescobre e agrega pelo tipo
+            logger.warning(f"⚠️ Fonte do usuário {user_id} recusada; agregando por tipo ({e})")
+            self.sources.invalidate(user_id)
+            buckets = await client.aggregate(request({t: AggregateSource.for_type(t) for t in ACTIVITY_TYPES}))
+
+        points = {data_type: [] for data_type in ACTIVITY_TYPES}
+        for bucket in buckets:
+            # Passos vêm em intVal; batimentos em fpVal (o primeiro é a média)
+            for index, data_type in enumerate(ACTIVITY_TYPES):
+                for point in bucket.points(index):
+                    if point.first is not None:
+                        points[data_type].append((bucket.start_ms, bucket.end_ms, point.first))
+        return points
+
+    @staticmethod
+    async def _load_watermarks(db: AsyncSession, user_id: int) -> dict:
+        result = await db.execute(select(SyncWatermark).where(SyncWatermark.user_id == user_id))
+        return {watermark.data_type: watermark for watermark in result.scalars()}
+
+    @staticmethod
+    def _window_start(watermark, now: datetime.datetime):
+        """Início da janela a buscar: watermark menos uma sobreposição para dados atrasados."""
+        if not watermark:
+            # Primeira sincronização: começa à meia-noite de hoje
+            return datetime.datetime.combine(now.date(), datetime.time.min)
+        overlap = datetime.timedelta(minutes=settings.SYNC_OVERLAP_MINUTES)
+        return watermark.synced_until - overlap
+
+    @staticmethod
+    def _advance_watermark(db: AsyncSession, watermark, user_id: int, data_type: str, synced_until: datetime.datetime):
+        if not watermark:
+            watermark = SyncWatermark(user_id=user_id, data_type=data_type, synced_until=synced_until)
+            db.add(watermark)
+        elif synced_until > watermark.synced_until:
+            watermark.synced_until = synced_until
+
+    @staticmethod
+    async def _store_points(db: AsyncSession, user_id: int, data_type: str, points):
+        """Insere ou atualiza os pontos pelo início (upsert em lote): um bucket regravado substitui o anterior."""
+        rows = [
+            {"user_id": user_id, "data_type": data_type, "start_time": _from_ms(start_ms), "end_time": _from_ms(end_ms), "value": value}
+            for start_ms, end_ms, value in points
+        ]
+        for i in range(0, len(rows), BATCH_SIZE):
+            await db.execute(upsert_statement(
+                db.bind.dialect.name, HealthDataPoint.__table__, rows[i:i + BATCH_SIZE],
+                ["user_id", "data_type", "start_time"], ("end_time", "value"),
+            ))
+
+    @staticmethod
+    async def daily_totals(db: AsyncSession, user_id: int, day: datetime.date):
+        """Calcula os totais de um dia a partir dos pontos locais, sem chamar o Google.
+
+        Métricas sem nenhum ponto no dia ficam de fora do dicionário (não viram 0 nem nulo).
+        """
+        day_start = datetime.datetime.combine(day, datetime.time.min)
+        day_end = day_start + datetime.timedelta(days=1)
+
+        def in_day(data_type, column):
+            return (
+                HealthDataPoint.user_id == user_id,
+                HealthDataPoint.data_type == data_type,
+                column >= day_start,
+                column < day_end,
+            )
+
+        steps, heart, sleep_minutes = (await db.execute(select(
+            select(func.sum(HealthDataPoint.value)).where(*in_day(STEPS, HealthDataPoint.start_time)).scalar_subquery(),
+            select(func.avg(HealthDataPoint.value)).where(*in_day(HEART_RATE, HealthDataPoint.start_time)).scalar_subquery(),
+            # O sono conta para o dia em que a sessão terminou
+            select(func.sum(HealthDataPoint.value)).where(*in_day(SLEEP, HealthDataPoint.end_time)).scalar_subquery(),
+        ))).one()
+
+        totals = {}
+        if steps is not None:
+            totals["steps"] = int(steps)
+        if heart is not None:
+            totals["heart_rate_avg"] = round(float(heart), 1)
+        if sleep_minutes:
+            totals["sleep_hours"] = round(sleep_minutes / 60, 2)
+        return totals
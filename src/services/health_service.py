@@ -1,159 +1,88 @@
 import httpx
 import logging
-from datetime import datetime, timedelta, time
-from src.database.connection import SessionLocal
-from src.models.health_metric import User, OAuthToken, HealthMetric
+import time as clock
+from datetime import datetime
 from src.config.settings import settings
+from src.database.connection import db_session
+from src.database.rollups import period_start, previous_period_start, rollups_query
+from src.models.health_metric import User
+from src.models.daily_metrics import DailyMetrics
+from src.clients.google_fit_client import GoogleFitClient
+from src.clients.http_client import get_http_client
+from src.services.data_source_service import DataSourceResolver, data_source_resolver
+from src.services.google_fit_service import GoogleFitService
+from src.services.token_manager import TokenManager, token_manager
+from src.services.report_cache import ReportCache, report_cache
+from src.services.report_renderer import render_daily_report
 
 logger = logging.getLogger("mensageiro-fit")
 
-class HealthService:
-    def __init__(self):
-        self.base_url = "https://www.googleapis.com/fitness/v1/users/me"
-
-    async def get_valid_token(self, db, user_id):
-        """Garante um token de acesso válido, renovando-o se necessário."""
-        token_info = db.query(OAuthToken).filter_by(user_id=user_id).first()
-        
-        if not token_info:
-            logger.error(f"❌ Nenhum token OAuth encontrado para o usuário {user_id}")
-            return None
-        
-        # Se expirar em menos de 5 minutos, renova
-        if token_info.expires_at <= datetime.utcnow() + timedelta(minutes=5):
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(
-                    "https://oauth2.googleapis.com/token",
-                    data={
-                        "client_id": settings.GOOGLE_CLIENT_ID,
-                        "client_secret": settings.GOOGLE_CLIENT_SECRET,
-                        "refresh_token": token_info.refresh_token,
-                        "grant_type": "refresh_token",
-                    },
-                )
-                data = resp.json()
-                if "access_token" in data:
-                    token_info.access_token = data["access_token"]
-                    token_info.expires_at = datetime.utcnow() + timedelta(seconds=data["expires_in"])
-                    db.commit()
-                else:
-                    logger.error(f"❌ Erro ao renovar token Google: {data}")
-                    return None
-        
-        return token_info.access_token
-
-    async def fetch_steps(self, token):
-        """Busca o total de passos do dia atual."""
-        today = datetime.combine(datetime.today(), time.min)
-        now = datetime.now()
-        
-        payload = {
-            "aggregateBy": [{"dataSourceId": "derived:com.google.step_count.delta:com.google.android.gms:estimated_steps"}],
-            "bucketByTime": {"durationMillis": int((now - today).total_seconds() * 1000)},
-            "startTimeMillis": int(today.timestamp() * 1000),
-            "endTimeMillis": int(now.timestamp() * 1000),
-        }
+class ReportError(Exception):
+    """O relatório não pôde ser gerado; a mensagem é o aviso a mostrar ao usuário."""
 
-        async with httpx.AsyncClient() as client:
-            headers = {"Authorization": f"Bearer {token}"}
-            resp = await client.post(f"{self.base_url}/dataset:aggregate", json=payload, headers=headers)
-            data = resp.json()
-            try:
-                steps = data['bucket'][0]['dataset'][0]['point'][0]['value'][0]['intVal']
-                return steps
-            except (KeyError, IndexError):
-                return 0
-
-    async def fetch_heart_rate(self, token):
-        """Busca a média da frequência cardíaca do dia."""
-        today = datetime.combine(datetime.today(), time.min)
-        now = datetime.now()
-        
-        payload = {
-            "aggregateBy": [{"dataTypeName": "com.google.heart_rate.bpm"}],
-            "bucketByTime": {"durationMillis": int((now - today).total_seconds() * 1000)},
-            "startTimeMillis": int(today.timestamp() * 1000),
-            "endTimeMillis": int(now.timestamp() * 1000),
-        }
+class HealthService:
+    def __init__(
+        self, client: httpx.AsyncClient = None, tokens: TokenManager = None, cache: ReportCache = None,
+        sources: DataSourceResolver = None,
+    ):
+        self.client = client or get_http_client()
+        self.tokens = tokens or token_manager
+        self.cache = cache or report_cache
+        self.sources = sources or data_source_resolver
 
-        async with httpx.AsyncClient() as client:
-            headers = {"Authorization": f"Bearer {token}"}
-            resp = await client.post(f"{self.base_url}/dataset:aggregate", json=payload, headers=headers)
-            data = resp.json()
-            try:
-                # Pega a média (fpVal) do primeiro bucket
-                return int(data['bucket'][0]['dataset'][0]['point'][0]['value'][0]['fpVal'])
-            except (KeyError, IndexError):
-                return 0
+    async def fetch_daily_metrics(self, token, user_id: int) -> DailyMetrics:
+        """Sincroniza o delta do dia e devolve os totais calculados dos pontos locais.
 
-    async def fetch_sleep(self, token):
-        """Busca a duração do sono nas últimas 24 horas via Sessões."""
-        now = datetime.utcnow()
-        yesterday = now - timedelta(days=1)
-        
-        start_time = yesterday.isoformat() + "Z"
-        end_time = now.isoformat() + "Z"
+        Tudo dentro do orçamento de tempo do relatório; uma chamada que falhe ou estoure
+        o prazo não derruba as outras: as métricas dela voltam marcadas em `missing`.
+        """
+        fit = GoogleFitClient(token, self.client, deadline=clock.monotonic() + settings.REPORT_FIT_BUDGET_SECONDS)
+        return await GoogleFitService(fit, self.sources).sync_user_data(user_id)
 
-        url = f"{self.base_url}/sessions"
-        params = {
-            "startTime": start_time,
-            "endTime": end_time,
-            "activityType": 72  # ID 72 = Sleep
-        }
+    async def generate_daily_report(self, user_id):
+        """Orquestra a busca de todos os dados e formata o relatório de um usuário.
 
-        async with httpx.AsyncClient() as client:
-            headers = {"Authorization": f"Bearer {token}"}
-            resp = await client.get(url, headers=headers, params=params)
-            sessions = resp.json().get('session', [])
-            
-            total_minutes = 0
-            for s in sessions:
-                start = int(s['startTimeMillis'])
-                end = int(s['endTimeMillis'])
-                total_minutes += (end - start) / 60000
-            
-            if total_minutes == 0:
-                return "Dados não registrados"
-                
-            hours = int(total_minutes // 60)
-            minutes = int(total_minutes % 60)
-            return f"{hours}h {minutes}min"
+        Levanta ReportError quando não há relatório a entregar (usuário ou token ausente,
+        erro interno): o lote conta a falha e o usuário não é marcado como atendido.
+        """
+        today = datetime.today().date()
+        window = (today, today)
+        cached = self.cache.get(user_id, window)
+        if cached is not None:
+            return cached
 
-    async def generate_daily_report(self):
-        """Orquestra a busca de todos os dados e formata o relatório."""
-        db = SessionLocal()
         try:
-            # 1. Verifica usuário
-            user = db.query(User).filter_by(email=settings.USER_EMAIL).first()
-            if not user:
-                return "⚠️ Usuário não cadastrado no banco."
+            # 1. Verifica usuário (sessão curta: nenhuma conexão fica presa durante as chamadas HTTP)
+            async with db_session() as db:
+                user_exists = await db.get(User, user_id) is not None
+            if not user_exists:
+                raise ReportError("⚠️ Usuário não cadastrado no banco.")
 
             # 2. Verifica Token
-            token = await self.get_valid_token(db, user.id)
+            token = await self.tokens.get_token(user_id)
             if not token:
-                return "⚠️ Falha ao obter acesso ao Google Fit."
+                raise ReportError("⚠️ Falha ao obter acesso ao Google Fit.")
 
-            # 3. Coleta Métricas
-            steps = await self.fetch_steps(token)
-            heart = await self.fetch_heart_rate(token)
-            sleep = await self.fetch_sleep(token)
+            # 3. Coleta Métricas: sincroniza só o delta e grava os totais do dia (upsert por
+            # usuário e dia, que também atualiza os agregados da semana e do mês)
+            metrics = await self.fetch_daily_metrics(token, user_id)
 
-            # 4. Opcional: Salva no banco (somente passos no modelo atual)
-            # Se você quiser salvar batimentos e sono, precisará alterar o Model HealthMetric
-            metric = HealthMetric(user_id=user.id, date=datetime.today().date(), steps=steps)
-            db.add(metric)
-            db.commit()
+            # 4. Semana atual e anterior direto da tabela de agregados (sem reler o histórico)
+            async with db_session() as db:
+                week_start = period_start("week", today)
+                last_week_start = previous_period_start("week", week_start)
+                rollups = {
+                    r.period_start: r for r in
+                    (await db.execute(rollups_query(user_id, "week", [week_start, last_week_start]))).scalars()
+                }
 
-            # 5. Formata Mensagem Final
-            return (
-                f"📊 *Resumo de Saúde do Dia*\n\n"
-                f"👣 *Passos:* {steps}\n"
-                f"❤️ *Batimentos Médios:* {heart} BPM\n"
-                f"😴 *Sono (24h):* {sleep}\n\n"
-                f"🔥 *Continue focado em sua saúde!*"
-            )
+            # 5. Formata Mensagem Final (só relatórios completos entram no cache)
+            report = render_daily_report(metrics, rollups.get(week_start), rollups.get(last_week_start))
+            if metrics.complete:
+                self.cache.set(user_id, window, report)
+            return report
+        except ReportError:
+            raise
         except Exception as e:
             logger.error(f"Erro ao gerar relatório: {e}")
-            return "❌ Erro interno ao processar dados de saúde."
-        finally:
-            db.close()
\ No newline at end of file
+            raise ReportError("❌ Erro interno ao processar dados de saúde.") from e
@@ -0,0 +1,189 @@
+import cProfile
+import functools
+import logging
+import os
+import time
+from datetime import datetime
+import httpx
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from sqlalchemy import event, exc as sqlalchemy_exc
+from src.config.settings import settings
+
+logger = logging.getLogger("mensageiro-fit")
+
+# Métricas do processo (expostas em /metrics no formato do Prometheus)
+HTTP_REQUEST_SECONDS = Histogram(
+    "mensageiro_http_request_seconds",
+    "Duração das chamadas externas (Google Fit, OAuth e Telegram)",
+    ["service", "endpoint", "status"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "mensageiro_db_query_seconds",
+    "Duração das consultas ao banco",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "mensageiro_db_pool_checkout_seconds",
+    "Espera por uma conexão do pool do banco (alta = pool saturado)",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "mensageiro_db_pool_connections", "Conexões do pool por estado (checked_out, idle, overflow)", ["engine", "state"]
+)
+DB_POOL_SATURATION = Gauge(
+    "mensageiro_db_pool_saturation", "Conexões em uso / (pool_size + max_overflow)", ["engine"]
+)
+TOKEN_REFRESH_SECONDS = Histogram(
+    "mensageiro_token_refresh_seconds", "Duração da renovação de tokens OAuth", ["result"]
+)
+REPORT_SECONDS = Histogram(
+    "mensageiro_report_seconds",
+    "Geração do relatório de um usuário (da fila do semáforo até o texto pronto)",
+    ["result"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+JOB_SECONDS = Histogram(
+    "mensageiro_job_seconds", "Duração dos jobs agendados", ["job"],
+    buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+CHART_RENDER_SECONDS = Histogram(
+    "mensageiro_chart_render_seconds", "Renderização de um gráfico no pool de processos",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+RETRIES = Counter("mensageiro_retries_total", "Retentativas por componente", ["component"])
+FAILURES = Counter("mensageiro_failures_total", "Falhas por componente e motivo", ["component", "reason"])
+SCHEDULER_LAG = Gauge("mensageiro_scheduler_lag_seconds", "Atraso entre o início do slot e a execução do job de entrega")
+POLLER_OFFSET = Gauge("mensageiro_telegram_poll_offset", "Último update_id confirmado no getUpdates")
+CIRCUIT_OPEN = Gauge("mensageiro_circuit_open", "1 quando o disjuntor do endpoint está aberto", ["endpoint"])
+TELEGRAM_QUEUE_DEPTH = Gauge("mensageiro_telegram_queue_depth", "Mensagens aguardando envio (inclui reenvios agendados)")
+
+DB_OPERATIONS = {"select", "insert", "update", "delete"}
+
+def _http_labels(url: httpx.URL):
+    """(serviço, endpoint) com baixa cardinalidade: sem IDs nem o token do bot no rótulo."""
+    if url.host == "api.telegram.org":
+        return "telegram", url.path.rsplit("/", 1)[-1]
+    if url.host == "oauth2.googleapis.com":
+        return "google_oauth", url.path.strip("/") or "token"
+    if url.host == "www.googleapis.com":
+        return "google_fit", url.path.split("/users/me/", 1)[-1].split("/", 1)[0]
+    return url.host, "other"
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Transport do pool compartilhado que registra a duração e o status de cada chamada.
+
+    `in_flight` conta as requisições ainda sem resposta, incluindo as que esperam conexão livre.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        self.in_flight += 1
+        try:
+            response = await super().handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            self.in_flight -= 1
+            service, endpoint = _http_labels(request.url)
+            HTTP_REQUEST_SECONDS.labels(service, endpoint, status).observe(time.perf_counter() - started)
+
+def instrument_engine(engine):
+    """Mede cada consulta do engine (para o assíncrono, passe `async_engine.sync_engine`)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+        DB_QUERY_SECONDS.labels(operation if operation in DB_OPERATIONS else "other").observe(
+            time.perf_counter() - started
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+        FAILURES.labels("database", type(context.original_exception).__name__).inc()
+
+class TimedPoolMixin:
+    """Mede a espera no checkout do pool; `engine_role` vem da subclasse criada em timed_pool_class.
+
+    recreate() (engine.dispose) usa a mesma classe, então a medição sobrevive ao descarte do pool.
+    """
+    engine_role = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sqlalchemy_exc.TimeoutError:
+            FAILURES.labels("db_pool", "checkout_timeout").inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.engine_role).observe(time.perf_counter() - started)
+
+def timed_pool_class(base, role: str):
+    """Subclasse de `base` (QueuePool/AsyncAdaptedQueuePool) que registra o checkout como `role`."""
+    # __module__ do SQLAlchemy: os logs do pool seguem sob o logger "sqlalchemy.pool" (nível WARN)
+    return type(f"Timed{base.__name__}", (TimedPoolMixin, base), {"engine_role": role, "__module__": base.__module__})
+
+def watch_pool(engine, role: str, max_overflow: int):
+    """Expõe o uso do pool de `engine` (para o assíncrono, passe `async_engine.sync_engine`)."""
+    def checked_out():
+        return engine.pool.checkedout()
+
+    def saturation():
+        capacity = engine.pool.size() + max_overflow
+        return engine.pool.checkedout() / capacity if capacity else 0.0
+
+    DB_POOL_CONNECTIONS.labels(role, "checked_out").set_function(checked_out)
+    DB_POOL_CONNECTIONS.labels(role, "idle").set_function(lambda: engine.pool.checkedin())
+    DB_POOL_CONNECTIONS.labels(role, "overflow").set_function(lambda: max(engine.pool.overflow(), 0))
+    DB_POOL_SATURATION.labels(role).set_function(saturation)
+
+def instrumented_job(name: str):
+    """Decorator de jobs assíncronos: registra a duração e, com PROFILE_JOBS, grava um dump do cProfile.
+
+    O cProfile vale para a thread inteira: o dump inclui as outras tarefas do event loop
+    que rodaram durante o job.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            profiler = cProfile.Profile() if settings.PROFILE_JOBS else None
+            if profiler:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Outro job já está sendo perfilado nesta thread
+                    profiler = None
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                JOB_SECONDS.labels(name).observe(time.perf_counter() - started)
+                if profiler:
+                    profiler.disable()
+                    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+                    path = os.path.join(settings.PROFILE_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.prof")
+                    profiler.dump_stats(path)
+                    logger.info(f"🧪 Perfil do job {name} gravado em {path}")
+        return wrapper
+    return decorator
+
+def start_metrics_server():
+    """Sobe o endpoint /metrics numa thread própria (não disputa o event loop)."""
+    if not settings.METRICS_ENABLED:
+        return
+    start_http_server(settings.METRICS_PORT)
+    logger.info(f"📈 Métricas em http://0.0.0.0:{settings.METRICS_PORT}/metrics")
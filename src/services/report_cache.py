@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from src.config.settings import settings
+from src.database.upserts import on_health_metrics_upserted
+from src.models.health_metric import HealthMetric
+
+class ReportCache:
+    """Cache LRU com TTL dos relatórios renderizados, chaveado por (usuário, janela de datas).
+
+    Só é usado no event loop (relatórios, /hoje, sincronização e os eventos do ORM da sessão
+    assíncrona rodam todos nele), então dispensa lock: nenhuma operação cede o loop no meio.
+    """
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self.max_entries = max_entries or settings.REPORT_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.REPORT_CACHE_TTL_SECONDS
+        self._entries: OrderedDict = OrderedDict()
+        self._keys_by_user: dict[int, set] = {}
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, user_id: int, window):
+        key = (user_id, window)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return entry[1]
+
+    def set(self, user_id: int, window, report: str):
+        key = (user_id, window)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, report)
+        self._entries.move_to_end(key)
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.counters["evictions"] += 1
+
+    def invalidate_user(self, user_id: int):
+        """Descarta todos os relatórios do usuário (dados dele mudaram)."""
+        keys = self._keys_by_user.pop(user_id, set())
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys:
+            self.counters["invalidations"] += len(keys)
+
+    def clear(self):
+        """Esvazia o cache (benchmarks e testes que recriam o banco)."""
+        self._entries.clear()
+        self._keys_by_user.clear()
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        user_keys = self._keys_by_user.get(key[0])
+        if user_keys:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[key[0]]
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), **self.counters}
+
+report_cache = ReportCache()
+
+@event.listens_for(HealthMetric, "after_insert")
+@event.listens_for(HealthMetric, "after_update")
+def _invalidate_on_metric_write(mapper, connection, target):
+    # Qualquer gravação de HealthMetric pelo ORM derruba os relatórios daquele usuário
+    report_cache.invalidate_user(target.user_id)
+
+@on_health_metrics_upserted
+def _invalidate_on_metric_upsert(user_ids):
+    # O upsert em lote (relatório, sincronização, backfill) não passa pelos eventos acima
+    for user_id in user_ids:
+        report_cache.invalidate_user(user_id)
@@ -0,0 +1,45 @@
+from typing import Optional
+from src.models.daily_metrics import DailyMetrics
+from src.models.health_metric import MetricRollup
+
+# Os valores ficam numéricos no banco e nos serviços; o texto só nasce aqui.
+
+UNAVAILABLE = "⚠️ indisponível no momento"
+
+def format_sleep(hours: Optional[float]) -> str:
+    if not hours:
+        return "Dados não registrados"
+    total_minutes = int(round(hours * 60))
+    return f"{total_minutes // 60}h {total_minutes % 60}min"
+
+def format_heart_rate(bpm: Optional[float]) -> str:
+    return f"{round(bpm)} BPM" if bpm is not None else "Dados não registrados"
+
+def format_trend(current: Optional[float], previous: Optional[float]) -> str:
+    """Variação percentual, ex.: "▲ 12% vs semana passada"."""
+    if current is None or not previous:
+        return ""
+    change = (current - previous) / previous * 100
+    arrow = "▲" if change >= 0 else "▼"
+    return f" ({arrow} {abs(change):.0f}% vs semana passada)"
+
+def render_daily_report(
+    metrics: DailyMetrics, week: Optional[MetricRollup] = None, last_week: Optional[MetricRollup] = None
+) -> str:
+    def value(name, text):
+        return UNAVAILABLE if name in metrics.missing else text
+
+    report = (
+        f"📊 *Resumo de Saúde do Dia*\n\n"
+        f"👣 *Passos:* {value('steps', metrics.steps)}\n"
+        f"❤️ *Batimentos Médios:* {value('heart_rate', format_heart_rate(metrics.heart_rate_avg))}\n"
+        f"😴 *Sono (24h):* {value('sleep', format_sleep(metrics.sleep_hours))}\n"
+    )
+    if week and week.days:
+        previous = last_week.steps_avg if last_week else None
+        report += f"\n📈 *Média da semana:* {week.steps_avg:.0f} passos/dia{format_trend(week.steps_avg, previous)}\n"
+        if week.best_streak > 1:
+            report += f"🏅 *Sequência na meta:* {week.best_streak} dias\n"
+    if metrics.missing:
+        report += "\n⚠️ Parte dos dados do Google Fit não respondeu a tempo. Envie /hoje mais tarde para atualizar.\n"
+    return report + "\n🔥 *Continue focado em sua saúde!*"
@@ -0,0 +1,308 @@
+import asyncio
+import functools
+import logging
+import math
+import os
+import re
+import signal
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy import select, update, and_, or_
+from src.config.settings import settings
+from src.database.connection import AsyncSessionLocal, engine
+from src.database.state import load_state, save_state
+from src.models.health_metric import User, OAuthToken, SchedulerInstance, ShardLease
+
+logger = logging.getLogger("mensageiro-fit")
+
+def slot_bounds(now_utc: datetime, slot_minutes: int):
+    """Início e fim (UTC) do slot de entrega que contém `now_utc`."""
+    slot_seconds = slot_minutes * 60
+    start = datetime.fromtimestamp(now_utc.timestamp() // slot_seconds * slot_seconds, timezone.utc)
+    return start, start + timedelta(seconds=slot_seconds)
+
+def jitter_seconds(user_id: int, slot_seconds: float) -> float:
+    """Atraso estável do usuário dentro do slot: espalha a carga sem mudar o horário de um dia para o outro."""
+    # Hash multiplicativo (Knuth) para espalhar IDs sequenciais pelo slot
+    return (user_id * 2654435761 % 2**32) / 2**32 * slot_seconds
+
+class DeliveryScheduler:
+    """Agenda relatórios por horário local de cada usuário, em slots, repartindo usuários entre réplicas.
+
+    Com SCHEDULER_SHARDS > 1 os usuários são divididos por `id % SCHEDULER_SHARDS` e cada
+    réplica só processa os shards cujo lease (tabela shard_leases) detém. Heartbeat e leases
+    são renovados por um laço próprio (start), a cada terço de SCHEDULER_LEASE_SECONDS: as
+    réplicas se enxergam vivas e dividem os shards independentemente do tamanho do slot.
+    """
+
+    def __init__(self, instance_id: str = None, shards: int = None, session_factory=AsyncSessionLocal):
+        self.instance_id = instance_id or settings.INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.shards = shards or settings.SCHEDULER_SHARDS
+        self._session_factory = session_factory
+        self.owned_shards: set[int] = set(range(self.shards)) if self.shards == 1 else set()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    async def rebalance(self) -> set:
+        """Renova o heartbeat e os leases, soltando ou pegando shards até a fatia justa."""
+        if self.shards == 1:
+            return self.owned_shards
+
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        stale = now - timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+
+        async with self._session_factory() as db:
+            instance = await db.get(SchedulerInstance, self.instance_id)
+            if instance:
+                instance.heartbeat_at = now
+            else:
+                db.add(SchedulerInstance(instance_id=self.instance_id, heartbeat_at=now))
+
+            existing = set((await db.execute(select(ShardLease.shard_id))).scalars().all())
+            for shard_id in set(range(self.shards)) - existing:
+                db.add(ShardLease(shard_id=shard_id))
+            await db.commit()
+
+            live = (await db.execute(
+                select(SchedulerInstance.instance_id).where(SchedulerInstance.heartbeat_at >= stale)
+            )).scalars().all()
+            fair_share = math.ceil(self.shards / max(len(live), 1))
+
+            mine = sorted((await db.execute(
+                select(ShardLease.shard_id).where(ShardLease.owner == self.instance_id, ShardLease.expires_at > now)
+            )).scalars().all())
+            keep, release = mine[:fair_share], mine[fair_share:]
+
+            if keep:
+                await db.execute(
+                    update(ShardLease).where(ShardLease.shard_id.in_(keep), ShardLease.owner == self.instance_id)
+                    .values(expires_at=lease_until)
+                )
+            if release:
+                await db.execute(
+                    update(ShardLease).where(ShardLease.shard_id.in_(release), ShardLease.owner == self.instance_id)
+                    .values(owner=None, expires_at=None)
+                )
+
+            owned = set(keep)
+            free = (await db.execute(
+                select(ShardLease.shard_id).where(or_(ShardLease.owner.is_(None), ShardLease.expires_at <= now))
+            )).scalars().all()
+            for shard_id in free:
+                if len(owned) >= fair_share:
+                    break
+                # UPDATE condicional: só uma réplica consegue pegar o mesmo shard
+                result = await db.execute(
+                    update(ShardLease)
+                    .where(
+                        ShardLease.shard_id == shard_id,
+                        or_(ShardLease.owner.is_(None), ShardLease.expires_at <= now),
+                    )
+                    .values(owner=self.instance_id, expires_at=lease_until)
+                )
+                if result.rowcount == 1:
+                    owned.add(shard_id)
+            await db.commit()
+
+        if owned != self.owned_shards:
+            logger.info(f"🧩 Instância {self.instance_id} agora processa os shards {sorted(owned)} de {self.shards}")
+        self.owned_shards = owned
+        return owned
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"❌ Erro ao renovar os leases do agendador: {e!r}")
+            await asyncio.sleep(settings.SCHEDULER_LEASE_SECONDS / 3)
+
+    def start(self):
+        """Inicia a renovação periódica de heartbeat e leases (só com mais de um shard)."""
+        if self.shards > 1 and (self._heartbeat_task is None or self._heartbeat_task.done()):
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def release(self):
+        """Para a renovação e solta os leases desta réplica (encerramento limpo) para outra assumir já."""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        if self.shards == 1:
+            return
+        async with self._session_factory() as db:
+            await db.execute(
+                update(ShardLease).where(ShardLease.owner == self.instance_id).values(owner=None, expires_at=None)
+            )
+            await db.commit()
+        self.owned_shards = set()
+
+    @staticmethod
+    def _watermark_key(shard_id: int) -> str:
+        return f"delivery_slot:{shard_id}"
+
+    async def pending_since(self, slot_start: datetime, shards: set = None) -> datetime:
+        """Início da janela a entregar: o watermark mais antigo dos shards desta réplica.
+
+        Slots perdidos (queda, deploy, job atrasado) entram na janela do slot atual, até
+        SCHEDULER_CATCHUP_HOURS para trás; shards sem watermark começam no slot atual.
+        `shards` fixa o conjunto usado pelo job (padrão: os shards detidos agora).
+        """
+        shards = self.owned_shards if shards is None else shards
+        if not shards:
+            return slot_start
+        # A janela precisa caber em menos de um dia para o filtro por horário local valer
+        floor = slot_start - timedelta(hours=min(settings.SCHEDULER_CATCHUP_HOURS, 23))
+        async with self._session_factory() as db:
+            stored = await load_state(db, [self._watermark_key(shard_id) for shard_id in shards])
+        watermarks = [datetime.fromisoformat(value) for value in stored.values()]
+        if len(watermarks) < len(shards):
+            watermarks.append(slot_start)
+        return min(max(min(watermarks), floor), slot_start)
+
+    async def mark_delivered(self, slot_end: datetime, shards: set = None):
+        """Avança o watermark dos shards processados até o fim do slot.
+
+        O job passa os shards que fixou no início: um shard assumido no meio do lote (o
+        heartbeat roda em paralelo) mantém o watermark antigo e é recuperado no próximo slot.
+        """
+        shards = self.owned_shards if shards is None else shards
+        if not shards:
+            return
+        async with self._session_factory() as db:
+            await save_state(db, {self._watermark_key(shard_id): slot_end.isoformat() for shard_id in shards})
+            await db.commit()
+
+    async def due_recipients(self, slot_start: datetime, slot_end: datetime, shards: set = None):
+        """Usuários dos `shards` (padrão: os desta réplica) com horário local em [slot_start, slot_end).
+
+        Quem já recebeu o relatório desde `slot_start` fica de fora: reprocessar uma janela
+        (catch-up após queda) não reenvia.
+        """
+        shards = self.owned_shards if shards is None else shards
+        if not shards:
+            return []
+
+        async with self._session_factory() as db:
+            timezones = (await db.execute(select(User.timezone).distinct())).scalars().all()
+
+            conditions = []
+            for tz_name in timezones:
+                try:
+                    tz = ZoneInfo(tz_name)
+                except (KeyError, ValueError):
+                    logger.warning(f"⚠️ Fuso horário inválido no cadastro: {tz_name!r}")
+                    continue
+                local_start = slot_start.astimezone(tz).time().replace(tzinfo=None)
+                local_end = slot_end.astimezone(tz).time().replace(tzinfo=None)
+                if local_end > local_start:
+                    in_window = and_(User.report_time >= local_start, User.report_time < local_end)
+                else:
+                    # Slot atravessa a meia-noite local
+                    in_window = or_(User.report_time >= local_start, User.report_time < local_end)
+                conditions.append(and_(User.timezone == tz_name, in_window))
+
+            if not conditions:
+                return []
+
+            query = (
+                select(User.id, User.telegram_chat_id)
+                .join(OAuthToken, OAuthToken.user_id == User.id)
+                .where(
+                    User.telegram_chat_id.isnot(None),
+                    or_(*conditions),
+                    or_(User.last_report_at.is_(None), User.last_report_at < slot_start.replace(tzinfo=None)),
+                )
+            )
+            if self.shards > 1:
+                query = query.where((User.id % self.shards).in_(shards))
+            return (await db.execute(query)).all()
+
+delivery_scheduler = DeliveryScheduler()
+
+_running_jobs: set[asyncio.Task] = set()
+
+def tracked_job(func):
+    """Registra a execução do job para o encerramento esperar por ela (drain_jobs)."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        task = asyncio.current_task()
+        _running_jobs.add(task)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _running_jobs.discard(task)
+    return wrapper
+
+async def drain_jobs(timeout: float):
+    """Espera os jobs em andamento por até `timeout`; os que sobrarem são cancelados.
+
+    Um job de entrega cancelado não avança o watermark: o slot é retomado no próximo start.
+    """
+    if not _running_jobs:
+        return
+    logger.info(f"⏳ Aguardando {len(_running_jobs)} job(s) em andamento...")
+    _, pending = await asyncio.wait(set(_running_jobs), timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        logger.warning(f"⚠️ {len(pending)} job(s) cancelado(s) no encerramento; serão retomados no próximo start.")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+def jobstore_table() -> Optional[str]:
+    """Tabela do job store desta instância, ou None para manter os jobs só em memória.
+
+    O APScheduler não divide um job store entre processos: com várias réplicas cada uma
+    precisa de um INSTANCE_ID fixo. Sem ele os slots perdidos ainda são recuperados pelo
+    watermark de entrega; só os jobs de intervalo recomeçam do zero.
+    """
+    if settings.SCHEDULER_SHARDS == 1:
+        return "apscheduler_jobs"
+    if settings.INSTANCE_ID:
+        return "apscheduler_jobs_" + re.sub(r"\W", "_", settings.INSTANCE_ID)
+    return None
+
+def start_scheduler(jobs):
+    """Sobe o AsyncIOScheduler com job store no banco e registra `jobs` [(id, func, trigger)].
+
+    Um job já persistido com o mesmo gatilho é mantido, com o próximo horário gravado:
+    execuções perdidas com o processo fora rodam uma vez (coalesce) ao subir.
+    """
+    # O APScheduler só carrega aqui: quem só importa os serviços (CLIs, benchmarks) não paga por ele
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+    table = jobstore_table()
+    jobstores = {"default": SQLAlchemyJobStore(engine=engine, tablename=table)} if table else {}
+    scheduler = AsyncIOScheduler(jobstores=jobstores, job_defaults={
+        "coalesce": True,
+        "max_instances": 1,
+        "misfire_grace_time": settings.SCHEDULER_MISFIRE_GRACE_SECONDS,
+    })
+    # Pausado: os jobs persistidos carregam antes de qualquer execução
+    scheduler.start(paused=True)
+    job_ids = {job_id for job_id, _, _ in jobs}
+    for job in scheduler.get_jobs():
+        if job.id not in job_ids:
+            job.remove()
+    for job_id, func, trigger in jobs:
+        existing = scheduler.get_job(job_id)
+        if existing and str(existing.trigger) == str(trigger):
+            continue
+        scheduler.add_job(func, trigger, id=job_id, replace_existing=True)
+    scheduler.resume()
+    return scheduler
+
+def shutdown_event() -> asyncio.Event:
+    """Evento disparado por SIGTERM/SIGINT (o `docker stop` manda SIGTERM)."""
+    event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, event.set)
+        except NotImplementedError:
+            # Windows: sem handlers no loop, o Ctrl+C ainda interrompe via KeyboardInterrupt
+            pass
+    return event
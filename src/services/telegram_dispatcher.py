@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+from src.config.settings import settings
+
+logger = logging.getLogger("mensageiro-fit")
+
+CommandHandler = Callable[[dict], Awaitable[None]]
+
+class CommandDispatcher:
+    """Roteia updates do Telegram para handlers de comando (/start, ...).
+
+    Usado tanto pelo polling quanto pelo webhook; cada update roda isolado,
+    então a falha de um não impede o processamento dos demais.
+    """
+
+    def __init__(self, concurrency: int = None):
+        self._handlers: dict[str, CommandHandler] = {}
+        self._semaphore = asyncio.Semaphore(concurrency or settings.TELEGRAM_UPDATE_CONCURRENCY)
+        self._background: set[asyncio.Task] = set()
+        self.counters = {"updates": 0, "handled": 0, "ignored": 0, "errors": 0}
+
+    def command(self, name: str):
+        """Decorador que registra o handler de um comando, ex.: @dispatcher.command("/start")."""
+        def decorator(handler: CommandHandler):
+            self._handlers[name] = handler
+            return handler
+        return decorator
+
+    @staticmethod
+    def parse_command(message: dict):
+        text = (message.get("text") or "").strip()
+        if not text.startswith("/"):
+            return None
+        # "/start@MeuBot argumento" -> "/start"
+        return text.split()[0].split("@")[0]
+
+    async def dispatch(self, update: dict) -> bool:
+        """Processa um update; retorna False se o handler falhou."""
+        self.counters["updates"] += 1
+        message = update.get("message") or {}
+        handler = self._handlers.get(self.parse_command(message))
+        if handler is None:
+            self.counters["ignored"] += 1
+            return True
+        async with self._semaphore:
+            try:
+                await handler(message)
+                self.counters["handled"] += 1
+                return True
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.error(f"❌ Erro ao processar update {update.get('update_id')}: {e!r}")
+                return False
+
+    def dispatch_in_background(self, update: dict):
+        """Agenda o update sem esperar (o webhook responde ao Telegram imediatamente)."""
+        task = asyncio.create_task(self.dispatch(update))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def drain(self):
+        """Aguarda os updates em andamento (usado no encerramento)."""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+
+dispatcher = CommandDispatcher()
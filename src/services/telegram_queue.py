@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Union
+import httpx
+from src.config.settings import settings
+from src.clients.http_client import get_http_client
+from src.database.connection import AsyncSessionLocal
+from src.models.health_metric import DeadLetterMessage
+from src.services.metrics import FAILURES, RETRIES, TELEGRAM_QUEUE_DEPTH
+from src.services.rate_limit import TokenBucket
+
+logger = logging.getLogger("mensageiro-fit")
+
+@dataclass
+class OutboundMessage:
+    chat_id: str
+    text: str  # legenda, quando há foto
+    parse_mode: Optional[str] = "Markdown"
+    # PNG a enviar (bytes) ou file_id de uma foto já enviada: vira um sendPhoto
+    photo: Union[bytes, str, None] = None
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    result: Optional[asyncio.Future] = None
+    # file_id devolvido pelo Telegram para a foto enviada
+    file_id: Optional[str] = None
+
+class TelegramDeliveryQueue:
+    """Fila de saída do Telegram com limites global/por chat, retentativas e dead-letter.
+
+    - 429: respeita o `retry_after` devolvido pela API.
+    - 5xx e falhas de rede: backoff exponencial com jitter.
+    - Outros 4xx ou tentativas esgotadas: grava em `dead_letter_messages`.
+    """
+
+    def __init__(self, client: httpx.AsyncClient = None, session_factory=AsyncSessionLocal):
+        self._client = client
+        self._session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._global_bucket = TokenBucket(settings.TELEGRAM_GLOBAL_RATE)
+        self._chat_buckets: dict[str, TokenBucket] = {}
+        # Reenvios agendados: id(mensagem) -> (timer do call_later, mensagem)
+        self._delayed: dict[int, tuple[asyncio.TimerHandle, OutboundMessage]] = {}
+        self._in_flight = 0
+        self._latencies = deque(maxlen=1000)
+        self.counters = {"sent": 0, "retries": 0, "rate_limited": 0, "dead_lettered": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
+
+    @property
+    def url(self) -> str:
+        return self.method_url("sendMessage")
+
+    @staticmethod
+    def method_url(method: str) -> str:
+        return f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/{method}"
+
+    def start(self):
+        """Sobe os workers da fila (idempotente)."""
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(settings.TELEGRAM_WORKERS)
+        ]
+
+    async def stop(self, timeout: float = 30.0):
+        """Espera a fila esvaziar (até `timeout`) e encerra os workers.
+
+        O que sobrar (na fila ou com reenvio agendado) é resolvido como não entregue:
+        quem aguarda send() recebe False em vez de ficar preso.
+        """
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._drained(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Fila do Telegram encerrada com {self.depth} mensagens pendentes.")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        for handle, message in self._delayed.values():
+            handle.cancel()
+            self._resolve(message, False)
+        self._delayed.clear()
+        while not self._queue.empty():
+            self._resolve(self._queue.get_nowait(), False)
+
+    async def _drained(self):
+        while self._delayed or not self._queue.empty() or self._in_flight:
+            await self._queue.join()
+            if self._delayed:
+                await asyncio.sleep(0.1)
+
+    @property
+    def depth(self) -> int:
+        return (self._queue.qsize() if self._queue else 0) + len(self._delayed)
+
+    async def send(self, chat_id, text, parse_mode: Optional[str] = "Markdown") -> bool:
+        """Enfileira a mensagem e aguarda o resultado final da entrega."""
+        self.start()
+        message = OutboundMessage(
+            chat_id=str(chat_id), text=text, parse_mode=parse_mode,
+            result=asyncio.get_running_loop().create_future(),
+        )
+        self._queue.put_nowait(message)
+        return await message.result
+
+    async def send_photo(self, chat_id, photo: Union[bytes, str], caption: str = "", parse_mode: Optional[str] = "Markdown") -> Optional[str]:
+        """Envia uma foto (PNG em bytes ou file_id) pela fila; devolve o file_id ou None se falhar.
+
+        Reenviar pelo file_id não sobe a imagem de novo: o Telegram reaproveita o arquivo.
+        """
+        self.start()
+        message = OutboundMessage(
+            chat_id=str(chat_id), text=caption, parse_mode=parse_mode, photo=photo,
+            result=asyncio.get_running_loop().create_future(),
+        )
+        self._queue.put_nowait(message)
+        return message.file_id if await message.result else None
+
+    def _bucket_for(self, chat_id: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # Descarta limitadores de chats ociosos para o dicionário não crescer sem fim
+                self._chat_buckets = {
+                    cid: b for cid, b in self._chat_buckets.items() if not b.is_idle()
+                }
+            bucket = TokenBucket(settings.TELEGRAM_PER_CHAT_RATE, capacity=1)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _worker(self):
+        while True:
+            message = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._deliver(message)
+            except asyncio.CancelledError:
+                # Encerramento no meio do envio: quem aguarda não fica preso
+                self._resolve(message, False)
+                raise
+            except Exception as e:
+                logger.error(f"❌ Erro inesperado na fila do Telegram: {e!r}")
+                self._resolve(message, False)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _deliver(self, message: OutboundMessage):
+        await self._bucket_for(message.chat_id).acquire()
+        await self._global_bucket.acquire()
+
+        message.attempts += 1
+        try:
+            resp = await self._post(message)
+        except httpx.TransportError as e:
+            return await self._retry(message, self._backoff(message.attempts), repr(e))
+
+        if resp.status_code == 200:
+            if message.photo is not None:
+                message.file_id = self._photo_file_id(resp)
+            self.counters["sent"] += 1
+            self._latencies.append(time.monotonic() - message.enqueued_at)
+            return self._resolve(message, True)
+
+        if resp.status_code == 429:
+            self.counters["rate_limited"] += 1
+            retry_after = self._retry_after(resp)
+            return await self._retry(message, retry_after, f"429 retry_after={retry_after}")
+
+        if resp.status_code >= 500:
+            return await self._retry(message, self._backoff(message.attempts), f"{resp.status_code}: {resp.text[:200]}")
+
+        # 4xx definitivo (chat bloqueado, Markdown inválido...): não adianta repetir
+        await self._dead_letter(message, f"{resp.status_code}: {resp.text[:200]}")
+
+    async def _post(self, message: OutboundMessage) -> httpx.Response:
+        if message.photo is None:
+            payload = {"chat_id": message.chat_id, "text": message.text}
+            if message.parse_mode:
+                payload["parse_mode"] = message.parse_mode
+            return await self.client.post(self.url, json=payload)
+
+        payload = {"chat_id": message.chat_id}
+        if message.text:
+            payload["caption"] = message.text
+            if message.parse_mode:
+                payload["parse_mode"] = message.parse_mode
+        if isinstance(message.photo, str):
+            return await self.client.post(self.method_url("sendPhoto"), json={**payload, "photo": message.photo})
+        # Upload multipart só na primeira vez; depois o chamador reenvia pelo file_id
+        return await self.client.post(
+            self.method_url("sendPhoto"), data=payload, files={"photo": ("grafico.png", message.photo, "image/png")},
+        )
+
+    @staticmethod
+    def _photo_file_id(resp: httpx.Response) -> Optional[str]:
+        # O Telegram devolve a foto em vários tamanhos; o file_id de qualquer um reenvia o original
+        try:
+            return resp.json()["result"]["photo"][-1]["file_id"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+
+    @staticmethod
+    def _retry_after(resp: httpx.Response) -> float:
+        try:
+            return float(resp.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return float(resp.headers.get("Retry-After", 1))
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        base = settings.TELEGRAM_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+        return base + random.uniform(0, base)
+
+    async def _retry(self, message: OutboundMessage, delay: float, error: str):
+        if message.attempts >= settings.TELEGRAM_MAX_ATTEMPTS:
+            return await self._dead_letter(message, error)
+        self.counters["retries"] += 1
+        RETRIES.labels("telegram").inc()
+        logger.warning(f"⚠️ Reenvio para chat {message.chat_id} em {delay:.1f}s ({error})")
+        # Reagenda sem prender o worker durante a espera
+        handle = asyncio.get_running_loop().call_later(delay, self._requeue, message)
+        self._delayed[id(message)] = (handle, message)
+
+    def _requeue(self, message: OutboundMessage):
+        self._delayed.pop(id(message), None)
+        if not self._workers:
+            # Fila já encerrada: não há worker para enviar
+            return self._resolve(message, False)
+        self._queue.put_nowait(message)
+
+    async def _dead_letter(self, message: OutboundMessage, error: str):
+        self.counters["dead_lettered"] += 1
+        FAILURES.labels("telegram", "dead_letter").inc()
+        logger.error(f"❌ Mensagem para chat {message.chat_id} descartada após {message.attempts} tentativas: {error}")
+        try:
+            async with self._session_factory() as db:
+                db.add(DeadLetterMessage(
+                    chat_id=message.chat_id, text=message.text if message.photo is None else f"[foto] {message.text}",
+                    error=error[:500], attempts=message.attempts,
+                ))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar dead-letter do chat {message.chat_id}: {e}")
+        self._resolve(message, False)
+
+    @staticmethod
+    def _resolve(message: OutboundMessage, delivered: bool):
+        if message.result and not message.result.done():
+            message.result.set_result(delivered)
+
+    def stats(self) -> dict:
+        """Profundidade da fila, contadores e latência de envio (da fila até o 200 do Telegram)."""
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+        return {
+            "depth": self.depth,
+            "in_flight": self._in_flight,
+            **self.counters,
+            "latency_p50": percentile(0.50),
+            "latency_p99": percentile(0.99),
+        }
+
+telegram_queue = TelegramDeliveryQueue()
+TELEGRAM_QUEUE_DEPTH.set_function(lambda: telegram_queue.depth)
@@ -0,0 +1,68 @@
+import hmac
+import logging
+from typing import TYPE_CHECKING
+from src.config.settings import settings
+from src.clients.http_client import get_http_client
+from src.services.telegram_dispatcher import CommandDispatcher, dispatcher as default_dispatcher
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+logger = logging.getLogger("mensageiro-fit")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def create_webhook_app(dispatcher: CommandDispatcher = None) -> "web.Application":
+    """Aplicação aiohttp que recebe os updates do Telegram no WEBHOOK_PATH."""
+    # O aiohttp só é carregado no modo webhook: no polling o bot sobe sem ele
+    from aiohttp import web
+
+    if not settings.TELEGRAM_WEBHOOK_SECRET:
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET é obrigatório no modo webhook.")
+    dispatcher = dispatcher or default_dispatcher
+
+    async def receive_update(request: "web.Request"):
+        # O Telegram repete o secret_token configurado no setWebhook em todo POST
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received, settings.TELEGRAM_WEBHOOK_SECRET):
+            logger.warning("⚠️ Webhook recebido com secret token inválido.")
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        dispatcher.dispatch_in_background(update)
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.router.add_post(settings.WEBHOOK_PATH, receive_update)
+    return app
+
+async def start_webhook_server(app: "web.Application" = None) -> "web.AppRunner":
+    """Sobe o servidor HTTP do webhook; devolve o runner para encerrar no shutdown."""
+    from aiohttp import web
+
+    runner = web.AppRunner(app or create_webhook_app())
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"🪝 Webhook escutando em {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+    return runner
+
+async def register_webhook():
+    """Informa ao Telegram a URL pública do webhook e o secret token."""
+    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/setWebhook"
+    resp = await get_http_client().post(url, json={
+        "url": settings.TELEGRAM_WEBHOOK_URL,
+        "secret_token": settings.TELEGRAM_WEBHOOK_SECRET,
+        "allowed_updates": ["message"],
+        "max_connections": settings.TELEGRAM_UPDATE_CONCURRENCY,
+    })
+    data = resp.json()
+    if not data.get("ok"):
+        raise RuntimeError(f"setWebhook falhou: {data}")
+
+async def delete_webhook():
+    """Remove o webhook; necessário para o getUpdates (polling) voltar a funcionar."""
+    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/deleteWebhook"
+    await get_http_client().post(url)
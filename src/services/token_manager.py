@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+import httpx
+from sqlalchemy import select
+from src.config.settings import settings
+from src.clients.http_client import get_http_client
+from src.database.connection import AsyncSessionLocal
+from src.models.health_metric import OAuthToken
+from src.services.metrics import FAILURES, TOKEN_REFRESH_SECONDS
+
+logger = logging.getLogger("mensageiro-fit")
+
+TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+@dataclass
+class CachedToken:
+    access_token: str
+    refresh_token: Optional[str]
+    expires_at: datetime
+    # Instante (time.monotonic) até o qual vale renovar antes de vencer; 0 = só carregado
+    keep_warm_until: float = 0.0
+
+    def expires_within(self, seconds: float) -> bool:
+        return self.expires_at <= datetime.utcnow() + timedelta(seconds=seconds)
+
+class TokenManager:
+    """Cache em memória dos access tokens do Google, com renovação única por usuário.
+
+    - Tokens válidos são servidos da memória; expirados são descartados.
+    - Renovações concorrentes do mesmo usuário compartilham uma única requisição.
+    - Um laço em segundo plano renova antes do vencimento os tokens em uso (ou esperados)
+      e grava no banco em lote.
+    """
+
+    def __init__(self, client: httpx.AsyncClient = None, session_factory=AsyncSessionLocal):
+        self._client = client
+        self._session_factory = session_factory
+        self._cache: dict[int, CachedToken] = {}
+        self._inflight: dict[int, asyncio.Task] = {}
+        self._dirty: set[int] = set()
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
+
+    async def get_token(self, user_id: int) -> Optional[str]:
+        """Retorna um access token válido para o usuário, renovando se necessário."""
+        cached = self._cache.get(user_id)
+        if cached:
+            cached.keep_warm_until = time.monotonic() + settings.TOKEN_KEEP_WARM_SECONDS
+        if cached and not cached.expires_within(settings.TOKEN_REFRESH_MARGIN_SECONDS):
+            self.stats["hits"] += 1
+            return cached.access_token
+
+        self.stats["misses"] += 1
+        if not cached:
+            cached = (await self._load([user_id])).get(user_id)
+            if not cached:
+                logger.error(f"❌ Nenhum token OAuth encontrado para o usuário {user_id}")
+                return None
+            cached.keep_warm_until = time.monotonic() + settings.TOKEN_KEEP_WARM_SECONDS
+            if not cached.expires_within(settings.TOKEN_REFRESH_MARGIN_SECONDS):
+                return cached.access_token
+
+        cached = await self._refresh_single_flight(user_id)
+        return cached.access_token if cached else None
+
+    async def warm(self, user_ids):
+        """Pré-carrega do banco, em uma única consulta, os tokens que ainda não estão em memória."""
+        missing = [user_id for user_id in user_ids if user_id not in self._cache]
+        if missing:
+            await self._load(missing)
+
+    async def expect(self, user_ids):
+        """Marca os tokens que serão usados em breve (ex.: o próximo slot) para a renovação antecipada."""
+        await self.warm(user_ids)
+        keep_warm_until = time.monotonic() + settings.TOKEN_KEEP_WARM_SECONDS
+        for user_id in user_ids:
+            cached = self._cache.get(user_id)
+            if cached:
+                cached.keep_warm_until = max(cached.keep_warm_until, keep_warm_until)
+
+    async def _load(self, user_ids) -> dict:
+        async with self._session_factory() as db:
+            result = await db.execute(select(OAuthToken).where(OAuthToken.user_id.in_(user_ids)))
+            rows = result.scalars().all()
+        loaded = {}
+        for row in rows:
+            loaded[row.user_id] = CachedToken(row.access_token, row.refresh_token, row.expires_at)
+        self._cache.update(loaded)
+        return loaded
+
+    async def _refresh_single_flight(self, user_id: int) -> Optional[CachedToken]:
+        """Garante no máximo uma renovação em andamento por usuário."""
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        # shield: o cancelamento de um chamador não derruba a renovação dos demais
+        return await asyncio.shield(task)
+
+    async def _refresh(self, user_id: int) -> Optional[CachedToken]:
+        cached = self._cache.get(user_id)
+        if not cached or not cached.refresh_token:
+            logger.error(f"❌ Usuário {user_id} sem refresh token para renovar o acesso.")
+            self._cache.pop(user_id, None)
+            return None
+
+        started = time.perf_counter()
+        result = "error"
+        try:
+            resp = await self.client.post(
+                TOKEN_URL,
+                data={
+                    "client_id": settings.GOOGLE_CLIENT_ID,
+                    "client_secret": settings.GOOGLE_CLIENT_SECRET,
+                    "refresh_token": cached.refresh_token,
+                    "grant_type": "refresh_token",
+                },
+            )
+            if resp.status_code >= 500:
+                # Página de erro do Google (muitas vezes HTML): falha temporária, não rejeição
+                data = {"error": f"HTTP {resp.status_code}"}
+            else:
+                try:
+                    data = resp.json()
+                except ValueError:
+                    data = {"error": f"HTTP {resp.status_code}: resposta sem JSON"}
+                result = "ok" if "access_token" in data else "rejected"
+        finally:
+            TOKEN_REFRESH_SECONDS.labels(result).observe(time.perf_counter() - started)
+            if result != "ok":
+                FAILURES.labels("token_refresh", result).inc()
+        if "access_token" not in data:
+            self.stats["refresh_failures"] += 1
+            logger.error(f"❌ Erro ao renovar token Google do usuário {user_id}: {data}")
+            # Token vencido não fica no cache; um ainda válido continua servindo
+            if cached.expires_within(0):
+                self._cache.pop(user_id, None)
+                return None
+            return cached
+
+        self.stats["refreshes"] += 1
+        refreshed = CachedToken(
+            access_token=data["access_token"],
+            refresh_token=data.get("refresh_token", cached.refresh_token),
+            expires_at=datetime.utcnow() + timedelta(seconds=data["expires_in"]),
+            keep_warm_until=cached.keep_warm_until,
+        )
+        self._cache[user_id] = refreshed
+        self._dirty.add(user_id)
+        return refreshed
+
+    async def flush(self):
+        """Grava no banco, em uma única transação, os tokens renovados desde o último flush."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, set()
+        try:
+            async with self._session_factory() as db:
+                result = await db.execute(select(OAuthToken).where(OAuthToken.user_id.in_(dirty)))
+                rows = result.scalars().all()
+                for row in rows:
+                    cached = self._cache.get(row.user_id)
+                    if cached:
+                        row.access_token = cached.access_token
+                        row.refresh_token = cached.refresh_token
+                        row.expires_at = cached.expires_at
+                await db.commit()
+            return len(rows)
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+    async def run_maintenance(self):
+        """Uma rodada do laço de fundo: descarta vencidos, renova os próximos do fim e grava em lote.
+
+        Só renova antes da hora os tokens em uso recente ou esperados (expect); os demais
+        são renovados sob demanda em get_token, sem gastar quota OAuth com quem não precisa.
+        """
+        for user_id, cached in list(self._cache.items()):
+            if cached.expires_within(0) and user_id not in self._inflight:
+                self._cache.pop(user_id, None)
+
+        now = time.monotonic()
+        expiring = [
+            user_id for user_id, cached in self._cache.items()
+            if cached.keep_warm_until > now and cached.expires_within(settings.TOKEN_PROACTIVE_REFRESH_SECONDS)
+        ]
+        if expiring:
+            results = await asyncio.gather(
+                *(self._refresh_single_flight(user_id) for user_id in expiring), return_exceptions=True
+            )
+            for user_id, result in zip(expiring, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"⚠️ Renovação antecipada falhou para o usuário {user_id}: {result!r}")
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar tokens renovados: {e}")
+
+    def clear(self):
+        """Descarta os tokens em memória (benchmarks e testes que recriam o banco)."""
+        self._cache.clear()
+        self._dirty.clear()
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(settings.TOKEN_MAINTENANCE_INTERVAL_SECONDS)
+            try:
+                await self.run_maintenance()
+            except Exception as e:
+                logger.error(f"❌ Erro na manutenção de tokens: {e}")
+
+    def start(self):
+        """Inicia o laço de renovação antecipada em segundo plano."""
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        """Para o laço de fundo e grava os tokens pendentes."""
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        await self.flush()
+
+token_manager = TokenManager()
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Variáveis mínimas para `src.config.settings` carregar fora do container
+for key, value in {
+    "DB_USER": "test", "DB_PASSWORD": "test", "DB_HOST": "localhost", "DB_PORT": "3306",
+    "DB_NAME": "test", "TELEGRAM_BOT_TOKEN": "test-token", "GOOGLE_CLIENT_ID": "test",
+    "GOOGLE_CLIENT_SECRET": "test", "USER_EMAIL": "test@example.com",
+}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
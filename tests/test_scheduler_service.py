@@ -0,0 +1,71 @@
+import asyncio
+import datetime
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from src.config.settings import settings
+from src.database.connection import Base
+from src.models.health_metric import OAuthToken, User
+from src.services.scheduler_service import DeliveryScheduler, slot_bounds
+
+UTC = datetime.timezone.utc
+
+async def _session_factory(path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # Usuário 1 (shard 1) recebe às 12:00 UTC; usuário 2 (shard 0), às 09:00
+        await conn.execute(insert(User), [
+            {"id": i, "email": f"user{i}@test", "google_id": f"g{i}", "telegram_chat_id": str(100 + i),
+             "report_time": report_time, "timezone": "UTC"}
+            for i, report_time in ((1, datetime.time(12, 0)), (2, datetime.time(9, 0)))
+        ])
+        await conn.execute(insert(OAuthToken), [
+            {"user_id": i, "access_token": f"access-{i}", "expires_at": datetime.datetime(2100, 1, 1)}
+            for i in (1, 2)
+        ])
+    return engine, async_sessionmaker(bind=engine, expire_on_commit=False)
+
+async def _split_shards(a, b):
+    # a pega tudo sozinho; com b vivo, a solta o excedente e b assume
+    await a.rebalance()
+    await b.rebalance()
+    await a.rebalance()
+    await b.rebalance()
+
+def test_failover_during_slot_keeps_watermark_of_taken_over_shard(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SCHEDULER_LEASE_SECONDS", 1)
+    monkeypatch.setattr(settings, "SCHEDULER_CATCHUP_HOURS", 6)
+
+    async def scenario():
+        engine, factory = await _session_factory(tmp_path / "scheduler.db")
+        a = DeliveryScheduler("a", shards=2, session_factory=factory)
+        b = DeliveryScheduler("b", shards=2, session_factory=factory)
+        await _split_shards(a, b)
+        assert a.owned_shards == {0} and b.owned_shards == {1}
+
+        # b entregou até as 11:55 e morreu; o slot das 12:00 ficou pendente no shard dele
+        missed_start, missed_end = slot_bounds(datetime.datetime(2024, 1, 1, 12, 0, tzinfo=UTC), 5)
+        await b.mark_delivered(missed_start)
+
+        # Job de a no slot seguinte: fixa os shards no início...
+        slot_start, slot_end = slot_bounds(missed_end, 5)
+        shards = set(a.owned_shards)
+        window_start = await a.pending_since(slot_start, shards)
+        recipients = await a.due_recipients(window_start, slot_end, shards)
+        assert [user_id for user_id, _ in recipients] == []
+
+        # ...e, no meio do lote, o heartbeat assume o shard de b com o lease vencido
+        await asyncio.sleep(1.1)
+        await a.rebalance()
+        assert a.owned_shards == {0, 1}
+        await a.mark_delivered(slot_end, shards)
+
+        # O shard assumido mantém o watermark antigo: o próximo slot recupera o usuário 1
+        next_start, next_end = slot_bounds(slot_end, 5)
+        window_start = await a.pending_since(next_start)
+        assert window_start == missed_start
+        recipients = await a.due_recipients(window_start, next_end)
+        assert [user_id for user_id, _ in recipients] == [1]
+        await engine.dispose()
+
+    asyncio.run(scenario())